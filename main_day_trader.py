@@ -1,13 +1,36 @@
 import os
 import time
+import asyncio
+import atexit
+import queue
+import logging
 import datetime
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.alpaca_utils.market_data_manager import MarketDataManager
 from src.alpaca_utils.account_manager import AccountManager
 from src.alpaca_utils.trade_manager import TradeManager
-from src.alpaca_utils.trading_strategy import TradingStrategy
+from src.alpaca_utils.trading_strategy import TradingStrategy, Side
 from src.alpaca_utils.risk_manager import RiskManager
 
+log = logging.getLogger("day_trader")
+
+def setup_logging(level=logging.INFO):
+    """
+    Routes log records through a queue to a background listener thread.
+    The trading loop only enqueues records; formatting and the stdout write happen off the hot path.
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s")
+    root = logging.getLogger()
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(log_queue)]
+
+    listener.start()
+    atexit.register(listener.stop)  # Flush pending records on exit
+
 # -------------------
 # Initialize modules
 # -------------------
@@ -25,29 +48,81 @@ risk_manager = RiskManager(
     max_notional_ratio=0.50
 )
 
+# Order side expected by TradeManager for each actionable signal
+ALPACA_SIDE = {Side.BUY: "buy", Side.SELL: "sell"}
+
+# Trading cycle length, aligned to the 5-minute bar grid
+CYCLE_MINUTES = 5
+
+# Concurrent order submissions per cycle, kept low to respect Alpaca's rate limits
+ORDER_WORKERS = 8
+
 def fetch_account_details():
     # -------------------
     # Fetch account details
     # -------------------
     account_info = account_manager.get_account_details()
-    print(f"📈 Equity: ${account_info['equity']}")
-    print(f"💰 Account Balance: ${account_info['cash']}")
-    print(f"💵 Buying Power: ${account_info['buying_power']}")
-    print(f"🔄 Profit/Loss Today: ${round(account_info['realized_pnl'], 2)}")
-    print(f"🛠️ Maintenance Margin: ${account_info['maintenance_margin']}")
-    print(f"📊 Margin Available: ${account_info['margin_available']}")
+    log.info("📈 Equity: $%s", account_info['equity'])
+    log.info("💰 Account Balance: $%s", account_info['cash'])
+    log.info("💵 Buying Power: $%s", account_info['buying_power'])
+    log.info("🔄 Profit/Loss Today: $%s", round(account_info['realized_pnl'], 2))
+    log.info("🛠️ Maintenance Margin: $%s", account_info['maintenance_margin'])
+    log.info("📊 Margin Available: $%s", account_info['margin_available'])
 
     # -------------------
     # Fetch open positions
     # -------------------
-    positions = account_manager.get_positions()
-    if positions:
-        print("\n📌 Open Positions:")
-        for pos in positions:
-            print(f" - {pos['symbol']}: {pos['qty']} shares, Market Value: ${pos['market_value']}, "
-                f"Unrealized P/L: ${pos['unrealized_pl']} ({pos['unrealized_plpc']:.2f}%)")
+    positions = account_manager.get_positions_df()
+    if not positions.empty:
+        log.info("📌 Open Positions:")
+        for pos in positions.itertuples():
+            log.info(" - %s: %s shares, Market Value: $%s, Unrealized P/L: $%s (%.2f%%)",
+                     pos.Index, pos.qty, pos.market_value, pos.unrealized_pl, pos.unrealized_plpc)
     else:
-        print("\n❌ No open positions.")
+        log.info("❌ No open positions.")
+
+
+def submit_order(order):
+    """
+    Places one queued market order and reports the outcome.
+    Errors are caught per order, so one failed request doesn't affect the others submitted alongside it.
+
+    :param order: Keyword arguments for `TradeManager.place_market_order`.
+    """
+    symbol = order["symbol"]
+    try:
+        order_response = trade_manager.place_market_order(**order)
+
+        if order_response:
+            minimal_order_info = {
+                "id": order_response.id,
+                "symbol": order_response.symbol,
+                "qty": order_response.qty,
+                "filled_qty": order_response.filled_qty,
+                "side": order_response.side,
+                "type": order_response.type,
+                "status": order_response.status,
+                "created_at": order_response.created_at,
+                "filled_at": order_response.filled_at
+            }
+            log.info("✅ Successfully executed order: %s", minimal_order_info)
+        else:
+            log.warning("⚠️ No order response received for %s.", symbol)
+    except Exception as e:
+        log.error("🚨 Error placing order for %s: %s", symbol, e)
+
+
+async def fetch_cycle_snapshot():
+    """
+    Fetches the account snapshot (market clock, account details, open positions) and bars for all
+    securities concurrently, so the cycle waits for the slowest request instead of the sum of all of them.
+    :return: (clock_data, account_info, open_positions, historical_data)
+    """
+    snapshot, historical_data = await asyncio.gather(
+        account_manager.get_snapshot(open_orders=False),
+        asyncio.to_thread(market_data_manager.fetch_historical_data),
+    )
+    return snapshot["clock"], snapshot["account"], snapshot["positions"], historical_data
 
 
 def run_day_trader():
@@ -55,131 +130,152 @@ def run_day_trader():
     Runs the main trading loop for the day-trading bot.
 
     - Continuously checks market open/close status.
-    - Iterates through the securities and fetches historical data.
-    - Updates the strategy buffer and generates trade signals.
-    - Applies risk management constraints before placing trades.
-    - Places market orders with stop-loss and take-profit parameters.
-    - Sleeps between iterations to align with 5-minute trading cycles.
+    - Fetches historical data for all securities in a single request and iterates through them.
+    - Updates the strategy buffers and generates trade signals for all securities in one vectorized pass.
+    - Sizes all actionable signals at once and applies portfolio risk constraints before placing trades.
+    - Places market orders with stop-loss and take-profit parameters concurrently.
+    - Sleeps until the next 5-minute bar boundary between iterations, so cycles don't drift.
     
     The loop runs until the market closes, at which point all positions are closed.
     """
 
     while True:
-        
+        cycle_start = time.monotonic()
+
         # -------------------
         # Check Market Status
         # -------------------
         # - If the market is closed, the script sleeps until the next open.
         # - If it's close to the end of the trading session, all positions are closed to avoid overnight risk.
+        # - Account details, positions and bars are fetched alongside the clock and reused for the whole cycle.
 
-        current_time, is_open, next_open, next_close = account_manager.get_market_clock_data()
+        clock_data, account_info, open_positions, historical_data = asyncio.run(fetch_cycle_snapshot())
+        current_time, is_open, next_open, next_close = clock_data
         time_until_close = (next_close - current_time).total_seconds()
 
         if not is_open:
             # Calculate sleep time until the market opens
             sleep_time = (next_open - current_time).total_seconds()
-            print(f"\n⏳ Market closed at {current_time.strftime('%Y-%m-%d %H:%M:%S')}. Waiting {int(sleep_time / 60)} minutes until next open at {next_open}...")
+            log.info("⏳ Market closed at %s. Waiting %d minutes until next open at %s...",
+                     current_time.strftime('%Y-%m-%d %H:%M:%S'), sleep_time / 60, next_open)
+            market_data_manager.clear_cache()  # Start the next session from a fresh bars window
             time.sleep(sleep_time)  # Sleep precisely until market opens
             continue  # Restart loop after waking up
 
         # Stop trading if market close time is less than 4 minutes away
         if int(time_until_close / 60) <= 4:
-            print("\n🏁 Market about to close. Closing all positions.")
+            log.info("🏁 Market about to close. Closing all positions.")
             account_manager.close_all_positions()
-            print("✅ All positions closed. Waiting for next market open.")
+            log.info("✅ All positions closed. Waiting for next market open.")
 
             # Sleep until next market open
             sleep_time = (next_open - current_time).total_seconds()
-            print(f"🛑 Market closed. Sleeping {int(sleep_time / 60)} minutes until {next_open}.")
+            log.info("🛑 Market closed. Sleeping %d minutes until %s.", sleep_time / 60, next_open)
+            market_data_manager.clear_cache()
             time.sleep(sleep_time)
             continue  # Restart loop after waking up
 
         # -------------------
         # Loop through all securities
         # -------------------
-        print(f'\n🚀 Running Day Trader at {current_time.strftime("%Y-%m-%d %H:%M:%S")}...')
+        log.info("🚀 Running Day Trader at %s...", current_time.strftime("%Y-%m-%d %H:%M:%S"))
 
-        for symbol in market_data_manager.stock_tickers + market_data_manager.etfs:
-            symbol_data = market_data_manager.fetch_historical_data(symbol=symbol)
+        # Bars come from one batched request per cycle, sliced per symbol below
+        symbols_with_data = set() if historical_data is None else set(historical_data.index.unique(level="symbol"))
 
-            if symbol_data is None or symbol_data.empty:
-                print(f"⚠️ No data found for {symbol}, skipping...")
+        # Symbols already held, kept in sync locally as orders are placed during this cycle
+        open_symbols = {pos["symbol"] for pos in open_positions}
+
+        # Update strategy buffers for every security with data
+        updated_symbols = []
+        for symbol in market_data_manager.all_symbols:
+            if symbol not in symbols_with_data:
+                log.warning("⚠️ No data found for %s, skipping...", symbol)
                 continue
+            trading_strategy.update_buffer_batch(symbol, historical_data.xs(symbol, level="symbol"))
+            updated_symbols.append(symbol)
+
+        # Generate trade signals for all securities in one vectorized pass
+        trade_signals = trading_strategy.generate_signals_vectorized(updated_symbols)
+        for symbol, trade_signal in trade_signals.items():
+            log.info("📈 Trade Signal for %s: %s", symbol, trade_signal.name)
+
+        # Only actionable signals on symbols we don't already hold go on to risk sizing
+        candidates = []
+        for symbol, trade_signal in trade_signals[trade_signals != Side.HOLD].items():
+            if symbol in open_symbols:
+                log.info("🚫 Skipping %s. Already have an open position.", symbol)
+            else:
+                candidates.append(symbol)
+
+        if candidates:
+            # Size every candidate at once; portfolio limits are applied below as orders are placed
+            candidate_bars = historical_data.loc[candidates]
+            risk_table = risk_manager.calculate_batch(
+                atr=risk_manager.compute_atr_batch(candidate_bars),
+                entry_prices=candidate_bars["close"].groupby(level="symbol").last().reindex(candidates),
+                sides=trade_signals[candidates].map(lambda side: side.name),
+                account_info=account_info
+            )
+
+        pending_orders = []
+        for symbol in candidates:
+            trade_signal = trade_signals[symbol]
+            entry_price = risk_table.at[symbol, "entry_price"]
+            log.debug("Entry Price for %s: %s", symbol, entry_price)
+
+            # Apply portfolio-level risk checks against this cycle's positions
+            risk_params = risk_manager.apply_portfolio_limits(risk_table.loc[symbol], account_info, open_positions)
+
+            log.debug("Calculated Risk Parameters: %s", risk_params)
+
+            if risk_params["quantity"] <= 0:
+                log.info("🚫 Skipping %s. Quantity is zero or invalid.", symbol)
+                continue  # Skip trade if no valid quantity
+
+            log.info("Trade Signal: %s, Entry Price: %s, Quantity: %s, Total Value: %s",
+                     trade_signal.name, entry_price, risk_params['quantity'], entry_price * risk_params['quantity'])
+
+            # If all checks pass, queue the order
+            log.info("Queueing %s order for %s...", trade_signal.name, symbol)
+            pending_orders.append({
+                "symbol": symbol,
+                "qty": risk_params["quantity"],
+                "side": ALPACA_SIDE[trade_signal],
+                "stop_loss_price": risk_params["stop_loss"],
+                "take_profit_price": risk_params["take_profit"],
+                # Validated against this cycle's snapshot (less the orders queued before it), so the
+                # order threads don't each fetch the account again
+                "buying_power": account_info["buying_power"]
+            })
+
+            # Reserve the new position in this cycle's snapshot so the next candidate's portfolio checks see it;
+            # it is re-synced from the server next cycle
+            trade_value = entry_price * risk_params["quantity"]
+            open_symbols.add(symbol)
+            open_positions.append({"symbol": symbol, "market_value": trade_value})
+            account_info["buying_power"] -= trade_value
+            if trade_signal == Side.BUY:
+                account_info["cash"] -= trade_value
+
+        # Submit all queued orders concurrently; each one is an independent REST round-trip
+        if pending_orders:
+            log.info("📤 Placing %d orders...", len(pending_orders))
+            with ThreadPoolExecutor(max_workers=ORDER_WORKERS) as executor:
+                futures = [executor.submit(submit_order, order) for order in pending_orders]
+                for future in as_completed(futures):
+                    future.result()
 
-            # Update strategy buffer
-            for _, row in symbol_data.iterrows():
-                trading_strategy.update_buffer(symbol, row)
-
-            # Generate trade signal
-            trade_signal = trading_strategy.generate_trade_signal(symbol)
-            print(f"📈 Trade Signal for {symbol}: {trade_signal}")
-
-            if trade_signal in ["BUY", "SELL"]:
-                # Re-fetch latest account details
-                account_info = account_manager.get_account_details()
-                open_positions = account_manager.get_positions()
-
-                # Skip if we already have an open position for this symbol
-                if any(pos["symbol"] == symbol for pos in open_positions):
-                    print(f"🚫 Skipping {symbol}. Already have an open position.")
-                    continue  # Skip this symbol and move to the next one
-
-                entry_price = symbol_data.iloc[-1]['close']
-                print(f"Entry Price for {symbol}: {entry_price}")
-
-                # Calculate trade parameters (includes portfolio-level risk checks)
-                risk_params = risk_manager.calculate_trade_parameters(
-                    df=symbol_data,
-                    entry_price=entry_price,
-                    account_info=account_info,
-                    open_positions=open_positions,
-                    side=trade_signal
-                )
-
-                print("Calculated Risk Parameters:", risk_params)
-
-                if risk_params["quantity"] <= 0:
-                    print(f"🚫 Skipping {symbol}. Quantity is zero or invalid.")
-                    continue  # Skip trade if no valid quantity
-
-                print(f"Trade Signal: {trade_signal}, Entry Price: {entry_price}, "
-                    f"Quantity: {risk_params['quantity']}, Total Value: {entry_price * risk_params['quantity']}")
-
-                # If all checks pass, place the order
-                print(f"Placing {trade_signal} order for {symbol}...")
-                try:
-                    order_response = trade_manager.place_market_order(
-                        symbol=symbol,
-                        qty=risk_params["quantity"],
-                        side=trade_signal.lower(),
-                        stop_loss_price=risk_params["stop_loss"],
-                        take_profit_price=risk_params["take_profit"]
-                    )
-
-                    if order_response:
-                        minimal_order_info = {
-                            "id": order_response.id,
-                            "symbol": order_response.symbol,
-                            "qty": order_response.qty,
-                            "filled_qty": order_response.filled_qty,
-                            "side": order_response.side,
-                            "type": order_response.type,
-                            "status": order_response.status,
-                            "created_at": order_response.created_at,
-                            "filled_at": order_response.filled_at
-                        }
-                        print("✅ Successfully executed order:", minimal_order_info)
-                    else:
-                        print("⚠️ No order response received.")
-                except Exception as e:
-                    print(f"🚨 Error placing order for {symbol}: {e}")
-                    continue
-        
-        # Sleep before fetching new data
-        sleep_time = min(time_until_close, 300)  # Sleep 5 minutes
-        print(f"🕒 Sleeping for {sleep_time} seconds before next check...")
+        # Sleep until the next bar boundary (HH:00, HH:05, ...) so the cycle length doesn't include the work time
+        log.debug("Cycle finished in %.2f seconds.", time.monotonic() - cycle_start)
+        now = datetime.datetime.now(current_time.tzinfo)
+        cycle_floor = now.replace(minute=now.minute - now.minute % CYCLE_MINUTES, second=0, microsecond=0)
+        next_boundary = cycle_floor + datetime.timedelta(minutes=CYCLE_MINUTES)
+        sleep_time = max(0.0, (min(next_boundary, next_close) - now).total_seconds())
+        log.info("🕒 Sleeping for %.0f seconds until %s before next check...", sleep_time, next_boundary.strftime("%H:%M"))
         time.sleep(sleep_time)
 
 if __name__ == '__main__':
+    setup_logging()
     fetch_account_details()
     run_day_trader()
\ No newline at end of file
@@ -1,29 +1,43 @@
 import os
-from dotenv import load_dotenv
+import pickle
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
 from alpaca.trading.client import TradingClient
-from alpaca.trading.requests import GetOrdersRequest, GetPortfolioHistoryRequest
+from alpaca.trading.requests import GetOrdersRequest, GetPortfolioHistoryRequest, GetCalendarRequest
 from alpaca.trading.enums import QueryOrderStatus, OrderSide, OrderStatus
 from alpaca.common.exceptions import APIError
+from src.alpaca_utils.env import get_alpaca_credentials
+
+MARKET_TZ = ZoneInfo("America/New_York")
+
+# Numeric fields reported for each open position
+POSITION_FIELDS = ["qty", "market_value", "cost_basis", "unrealized_pl", "unrealized_plpc"]
 
 class AccountManager:
     """
     Manages account and portfolio tasks (excluding order placement).
     """
 
-    def __init__(self, paper=True):
-        """Initialize the Alpaca Trading Client for account management."""
+    def __init__(self, paper=True, calendar_cache_path=os.path.join("data", "market_calendar.pkl"), calendar_days=30):
+        """
+        Initialize the Alpaca Trading Client for account management.
+        :param calendar_cache_path: File where upcoming market sessions are persisted between runs.
+        :param calendar_days: Number of days of market sessions fetched per calendar refresh.
+        """
         # Load environment variables
-        load_dotenv()
-
-        self.API_KEY = os.getenv("ALPACA_API_KEY")
-        self.SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-
-        if not self.API_KEY or not self.SECRET_KEY:
-            raise ValueError("Missing API credentials. Ensure they are set in the .env file.")
+        self.API_KEY, self.SECRET_KEY = get_alpaca_credentials()
 
         # Initialize Alpaca Trading Client (paper trading mode enabled by default)
         self.client = TradingClient(self.API_KEY, self.SECRET_KEY, paper=paper)
 
+        # Market sessions ({date: (open, close)}) used to answer clock queries locally
+        self.calendar_cache_path = calendar_cache_path
+        self.calendar_days = calendar_days
+        self._calendar_cache = self._load_calendar_cache()
+
     def get_account_details(self):
         """
         Fetch and return account details like balance, equity, and buying power.
@@ -44,92 +58,97 @@ class AccountManager:
             print(f"❌ Error fetching account details: {e}")
             return None
 
+    async def get_snapshot(self, open_orders=True):
+        """
+        Fetch the market clock, account details, open positions and (optionally) open orders concurrently.
+        Each call is an independent blocking REST request, so they run in worker threads and the
+        snapshot takes as long as the slowest one instead of the sum of all of them.
+
+        :param open_orders: Also fetch the open orders (None in the result when skipped).
+        :return: dict with keys 'clock', 'account', 'positions', 'open_orders'.
+        """
+        calls = [self.get_market_clock_data, self.get_account_details, self.get_positions]
+        if open_orders:
+            calls.append(self.get_open_orders)
+        results = await asyncio.gather(*(asyncio.to_thread(call) for call in calls))
+        clock, account, positions = results[:3]
+        return {"clock": clock, "account": account, "positions": positions,
+                "open_orders": results[3] if open_orders else None}
+
     def get_positions(self):
         """
         Fetch all open positions and return them as a list of dictionaries.
         """
+        return self.get_positions_df().reset_index().to_dict("records")
+
+    def get_positions_df(self):
+        """
+        Fetch all open positions as a DataFrame indexed by symbol.
+        Numeric fields are cast in a single pass and `unrealized_plpc` is expressed as a percentage.
+        """
         try:
             positions = self.client.get_all_positions()
-            position_data = []
-            
-            for pos in positions:
-                position_data.append({
-                    "symbol": pos.symbol,
-                    "qty": float(pos.qty),
-                    "market_value": float(pos.market_value),
-                    "cost_basis": float(pos.cost_basis),
-                    "unrealized_pl": float(pos.unrealized_pl),
-                    "unrealized_plpc": float(pos.unrealized_plpc) * 100,  # Convert to percentage
-                })
-
-            return position_data
-
         except APIError as e:
             print(f"❌ Error fetching positions: {e}")
-            return []
+            positions = []
+
+        # Gather raw attributes once, then cast every numeric field in a single NumPy pass
+        arr = np.array(
+            [[pos.symbol] + [getattr(pos, field) for field in POSITION_FIELDS] for pos in positions],
+            dtype=object,
+        ).reshape(-1, len(POSITION_FIELDS) + 1)
+        df = pd.DataFrame(arr[:, 1:].astype(np.float64), index=pd.Index(arr[:, 0], name="symbol"), columns=POSITION_FIELDS)
+        df["unrealized_plpc"] *= 100  # Convert to percentage
+        return df
 
     def get_closed_positions(self):
         """
         Fetch closed positions from trade history by retrieving past completed orders.
-        Properly calculates cost basis by matching SELL orders to prior BUY orders.
+        Properly calculates cost basis by matching SELL orders to prior BUY orders (FIFO, in fill order).
         """
         try:
-            closed_positions = []
             request = GetOrdersRequest(status=QueryOrderStatus.CLOSED)
             orders = self.client.get_orders(request)
 
-            # Step 1: Separate BUY and SELL orders
-            buy_orders = {}
-            sell_orders = []
-
-            for order in orders:
-                if order.side == OrderSide.BUY and order.status == OrderStatus.FILLED:
-                    buy_orders.setdefault(order.symbol, []).append(order)  # Store buy orders by symbol
-                elif order.side == OrderSide.SELL and order.status == OrderStatus.FILLED:
-                    sell_orders.append(order)  # Store sell orders
+            # Step 1: Keep filled orders, oldest fill first
+            orders_df = pd.DataFrame(
+                [(order.symbol, order.side, order.status, order.filled_qty, order.filled_avg_price, order.filled_at) for order in orders],
+                columns=["symbol", "side", "status", "filled_qty", "filled_avg_price", "filled_at"],
+            )
+            filled = (orders_df[orders_df["status"] == OrderStatus.FILLED]
+                      .astype({"filled_qty": float, "filled_avg_price": float})
+                      .sort_values("filled_at", kind="stable"))
 
-            # Step 2: Calculate Realized P/L by matching sells with previous buys
-            for sell_order in sell_orders:
-                symbol = sell_order.symbol
-                filled_qty = float(sell_order.filled_qty)
-                avg_sell_price = float(sell_order.filled_avg_price)
+            # Step 2: Cost basis of each SELL from cumulative quantities instead of a nested matching loop.
+            # C(x), the cost of the first x shares bought, is piecewise linear in the cumulative buy quantity,
+            # so a sell covering shares (before, after] of the symbol's sells costs C(after) - C(before).
+            is_buy = (filled["side"] == OrderSide.BUY).to_numpy()
+            qty = filled["filled_qty"].to_numpy()
+            price = filled["filled_avg_price"].to_numpy()
+            sells = filled[~is_buy]
+            cost_basis = pd.Series(np.nan, index=sells.index)
 
-                # 🔹 Market Value (Total revenue from selling)
-                market_value = filled_qty * avg_sell_price
+            for symbol, rows in filled.groupby("symbol", sort=False).indices.items():
+                buy = is_buy[rows]
+                if not buy.any():
+                    continue  # No BUY orders to match against
+                buy_cumqty = np.concatenate(([0.0], np.cumsum(qty[rows][buy])))
+                buy_cumcost = np.concatenate(([0.0], np.cumsum(qty[rows][buy] * price[rows][buy])))
+                sell_cumcost = np.interp(np.cumsum(qty[rows][~buy]), buy_cumqty, buy_cumcost)
+                cost_basis[filled.index[rows][~buy]] = np.diff(sell_cumcost, prepend=0.0)
 
-                # 🔹 Find matching BUY order(s) for cost basis
-                if symbol in buy_orders:
-                    total_cost = 0
-                    remaining_qty = filled_qty
-
-                    for buy_order in buy_orders[symbol]:
-                        if remaining_qty <= 0:
-                            break  # We matched all the sell quantity
-
-                        buy_qty = float(buy_order.filled_qty)
-                        avg_buy_price = float(buy_order.filled_avg_price)
-
-                        # Match available buy quantity to the sell quantity
-                        match_qty = min(remaining_qty, buy_qty)
-                        total_cost += match_qty * avg_buy_price
-                        remaining_qty -= match_qty  # Reduce remaining sell qty
-
-                    # 🔹 Cost Basis (Total cost of originally bought shares)
-                    cost_basis = total_cost
-
-                    # 🔹 Realized P/L (Profit or loss from selling)
-                    realized_pnl = round(market_value - cost_basis, 2)
-
-                    closed_positions.append({
-                        "symbol": symbol,
-                        "filled_qty": filled_qty,
-                        "avg_fill_price": avg_sell_price,
-                        "market_value": round(market_value, 2),
-                        "cost_basis": round(cost_basis, 2),
-                        "realized_pnl": realized_pnl,
-                    })
-
-            return closed_positions
+            # 🔹 Market Value (Total revenue from selling) and Realized P/L (Profit or loss from selling)
+            matched = sells[cost_basis.notna()]
+            cost_basis = cost_basis[matched.index]
+            market_value = matched["filled_qty"] * matched["filled_avg_price"]
+            return pd.DataFrame({
+                "symbol": matched["symbol"],
+                "filled_qty": matched["filled_qty"],
+                "avg_fill_price": matched["filled_avg_price"],
+                "market_value": market_value.round(2),
+                "cost_basis": cost_basis.round(2),
+                "realized_pnl": (market_value - cost_basis).round(2),
+            }).to_dict("records")
 
         except APIError as e:
             print(f"❌ Error fetching closed positions: {e}")
@@ -172,14 +191,64 @@ class AccountManager:
     def get_market_clock_data(self):
         """
         Check if the stock market is open before fetching real-time positions or placing trades.
+        The current time and open status come from the clock endpoint on every call; the next open and
+        close are read from the cached market calendar (refreshed once a day), falling back to the clock's.
         """
         try:
             clock = self.client.get_clock()
-            return clock.timestamp, clock.is_open, clock.next_open, clock.next_close
         except APIError as e:
             print(f"❌ Error fetching market clock: {e}")
             return None
 
+        now = clock.timestamp
+        sessions = self._upcoming_sessions(now)
+        if len(sessions) < 2 or self._calendar_cache.get("fetched_on") != now.astimezone(MARKET_TZ).date():
+            self._refresh_calendar_cache(now.astimezone(MARKET_TZ).date())
+            sessions = self._upcoming_sessions(now)
+
+        next_open = next((session_open for session_open, _ in sessions if session_open > now), None)
+        if next_open is None:
+            return now, clock.is_open, clock.next_open, clock.next_close
+        return now, clock.is_open, next_open, sessions[0][1]
+
+    def _upcoming_sessions(self, now):
+        """Return cached (open, close) sessions that have not closed yet, in chronological order."""
+        sessions = self._calendar_cache.get("sessions", {})
+        return [sessions[day] for day in sorted(sessions) if sessions[day][1] > now]
+
+    def _load_calendar_cache(self):
+        """Load the persisted market calendar, or start empty if it is missing or unreadable."""
+        try:
+            with open(self.calendar_cache_path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return {}
+
+    def _refresh_calendar_cache(self, start):
+        """Fetch the next `calendar_days` of market sessions in one request and persist them to disk."""
+        try:
+            request = GetCalendarRequest(start=start, end=start + timedelta(days=self.calendar_days))
+            calendar = self.client.get_calendar(request)
+        except APIError as e:
+            print(f"❌ Error fetching market calendar: {e}")
+            return
+
+        # Calendar open/close times are naive Eastern times
+        self._calendar_cache = {
+            "fetched_on": start,
+            "sessions": {
+                day.date: (day.open.replace(tzinfo=MARKET_TZ), day.close.replace(tzinfo=MARKET_TZ))
+                for day in calendar
+            },
+        }
+
+        try:
+            os.makedirs(os.path.dirname(self.calendar_cache_path) or ".", exist_ok=True)
+            with open(self.calendar_cache_path, "wb") as f:
+                pickle.dump(self._calendar_cache, f)
+        except OSError as e:
+            print(f"⚠️ Could not persist market calendar: {e}")
+
     def close_all_positions(self):
         """
         Close all open positions and cancel any existing open orders.
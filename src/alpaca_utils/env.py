@@ -0,0 +1,27 @@
+import os
+import functools
+
+@functools.cache
+def _load_env():
+    """
+    Reads the .env file at most once per process, so every manager shares a single load.
+    Skipped (along with importing python-dotenv) when the credentials are already in the environment.
+    """
+    if not (os.environ.get("ALPACA_API_KEY") and os.environ.get("ALPACA_SECRET_KEY")):
+        from dotenv import load_dotenv
+        load_dotenv()
+
+def get_alpaca_credentials():
+    """
+    Loads environment variables from the .env file (once per process) and returns the Alpaca credentials.
+    :return: (api_key, secret_key) tuple.
+    """
+    _load_env()
+
+    api_key = os.getenv("ALPACA_API_KEY")
+    secret_key = os.getenv("ALPACA_SECRET_KEY")
+
+    if not api_key or not secret_key:
+        raise ValueError("Missing API credentials. Ensure they are set in the .env file.")
+
+    return api_key, secret_key
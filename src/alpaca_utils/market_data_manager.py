@@ -1,12 +1,66 @@
-import os
-from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import pandas as pd
-from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
-from alpaca.data.enums import Adjustment
-from alpaca.data.historical.stock import StockHistoricalDataClient
-from alpaca.data.requests import StockBarsRequest
+from src.alpaca_utils.env import get_alpaca_credentials
+
+# pandas and alpaca.data are imported on first use, so account-only runs don't pay for loading them
+
+# Tracked universe, built once at import; tuples so they can also serve as cache keys
+STOCK_TICKERS = (
+    "AAPL", "MSFT", "AMZN", "GOOGL", "META", "NVDA",  # Tech giants (liquid + volatile)
+    "TSLA", "JPM", "BAC", "MA", "V",                   # High-beta names (TSLA, banks, credit cards)
+    "UNH", "HD", "DIS", "NFLX", "COST"                 # Diversification (healthcare, retail, media)
+)
+
+ETFS = (
+    "SPY", "QQQ", "IWM",      # Core market ETFs (S&P 500, Nasdaq, Russell 2000)
+    "VXX",                     # Volatility hedge (critical for risk-off moves)
+    "IYT", "XLE", "XLK", "XLB" # Sector ETFs (transportation, energy, tech, materials)
+)
+
+ALL_SYMBOLS = STOCK_TICKERS + ETFS
+_ALL_SYMBOLS_SET = frozenset(ALL_SYMBOLS)
+_ALL_SYMBOLS_LIST = list(ALL_SYMBOLS)  # symbol_or_symbols of every all-securities request
+
+# Bar attributes copied into the columns of a bars DataFrame, in the order `BarSet.df` produces them
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "trade_count", "vwap")
+
+def _bars_frame(bar_set):
+    """
+    Builds the same (symbol, timestamp) indexed DataFrame as `bar_set.df`, column by column.
+    `.df` dumps every Bar to a dict and lets pandas infer a row-oriented frame; here each field
+    is read straight into a preallocated float array instead.
+    """
+    import numpy as np
+    import pandas as pd
+
+    bars = [bar for symbol_bars in bar_set.data.values() for bar in symbol_bars]
+    columns = {}
+    for field in BAR_FIELDS:
+        values = np.fromiter((getattr(bar, field) for bar in bars), dtype=np.float64, count=len(bars))
+        if not np.isnan(values).all():  # `.df` drops fields missing from every bar
+            columns[field] = values
+
+    index = pd.MultiIndex.from_arrays(
+        [[bar.symbol for bar in bars], pd.DatetimeIndex([bar.timestamp for bar in bars])],
+        names=["symbol", "timestamp"],
+    )
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def _decode_with_orjson(client):
+    """
+    Makes an Alpaca client's HTTP session decode response bodies with orjson, which parses large bar
+    pages several times faster than the standard library. Left unchanged if orjson isn't installed.
+    """
+    try:
+        import orjson
+    except ImportError:
+        return
+
+    def hook(response, *args, **kwargs):
+        response.json = lambda **_: orjson.loads(response.content)
+        return response
+
+    client._session.hooks["response"].append(hook)
 
 class MarketDataManager:
     """
@@ -14,67 +68,138 @@ class MarketDataManager:
     Fetches historical stock and ETF data, retrieving 5-minute bars for the past 5 days by default.
     """
 
-    def __init__(self, timeframe=TimeFrame(5, TimeFrameUnit.Minute), days=5):
-        """Initialize Alpaca API client and set query parameters."""
-        load_dotenv()
-
-        self.api_key = os.getenv("ALPACA_API_KEY")
-        self.secret_key = os.getenv("ALPACA_SECRET_KEY")
+    def __init__(self, timeframe=None, days=5):
+        """
+        Set query parameters; the Alpaca data client is created on the first fetch.
+        :param timeframe: Bar timeframe (default = 5-minute bars).
+        :param days: Number of days of bars kept in the rolling window.
+        """
+        self.api_key, self.secret_key = get_alpaca_credentials()
+        self._client = None
 
-        if not self.api_key or not self.secret_key:
-            raise ValueError("Missing API credentials. Ensure they are set in the .env file.")
+        # Shared module-level universe; the frozenset backs O(1) membership checks
+        self.stock_tickers = STOCK_TICKERS
+        self.etfs = ETFS
+        self.all_symbols = ALL_SYMBOLS
+        self._symbols_set = _ALL_SYMBOLS_SET
 
-        self.client = StockHistoricalDataClient(self.api_key, self.secret_key)
+        self.timeframe = timeframe
+        self.days = days
 
-        self.stock_tickers = [
-            "AAPL", "MSFT", "AMZN", "GOOGL", "META", "NVDA",  # Tech giants (liquid + volatile)
-            "TSLA", "JPM", "BAC", "MA", "V",                   # High-beta names (TSLA, banks, credit cards)
-            "UNH", "HD", "DIS", "NFLX", "COST"                 # Diversification (healthcare, retail, media)
-        ]
+        # Rolling window of bars for all securities; later fetches only request bars newer than it
+        self._bars_cache = None
 
-        self.etfs = [
-            "SPY", "QQQ", "IWM",      # Core market ETFs (S&P 500, Nasdaq, Russell 2000)
-            "VXX",                     # Volatility hedge (critical for risk-off moves)
-            "IYT", "XLE", "XLK", "XLB" # Sector ETFs (transportation, energy, tech, materials)
-        ]
+    @property
+    def client(self):
+        """Alpaca historical data client, created on first access."""
+        if self._client is None:
+            from alpaca.data.historical.stock import StockHistoricalDataClient
+            self._client = StockHistoricalDataClient(self.api_key, self.secret_key)
+            _decode_with_orjson(self._client)
+        return self._client
 
-        self.timeframe = timeframe
-        self.days = days
+    def clear_cache(self):
+        """Drops the cached bars so the next fetch downloads the full `self.days` window again."""
+        self._bars_cache = None
 
     def fetch_historical_data(self, symbol=None):
         """
-        Fetches historical 5-minute bars for all securities or a specific symbol for the last `self.days` days.
+        Fetches historical 5-minute bars for all securities or specific symbols for the last `self.days` days.
+        Bars for all securities are cached, so repeated calls only download bars newer than the cached window.
 
-        :param symbol: (Optional) Fetch historical data for a specific stock/ETF.
-        :return: DataFrame with historical market data.
+        :param symbol: (Optional) Fetch historical data for a specific stock/ETF, or a list of them in one request.
+        :return: DataFrame with historical market data, indexed by (symbol, timestamp).
         """
+        import pandas as pd
+        from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+        from alpaca.data.enums import Adjustment
+        from alpaca.data.requests import StockBarsRequest
+
+        if self.timeframe is None:
+            self.timeframe = TimeFrame(5, TimeFrameUnit.Minute)
+
         now = datetime.now(ZoneInfo("America/New_York"))
+        window_start = now - timedelta(days=self.days)
 
         # Determine which symbols to request
-        symbols_to_fetch = [symbol] if symbol else self.stock_tickers + self.etfs
+        if not symbol:
+            symbols_to_fetch = _ALL_SYMBOLS_LIST
+        else:
+            symbols_to_fetch = [symbol] if isinstance(symbol, str) else list(symbol)
+        label = ", ".join(symbols_to_fetch) if symbol else "all securities"
+        cached = None if symbol else self._bars_cache
+
+        # Re-request the newest cached bar as well, in case it was updated after we fetched it
+        start = cached.index.get_level_values("timestamp").max() if cached is not None else window_start
 
         request = StockBarsRequest(
             symbol_or_symbols=symbols_to_fetch,
             timeframe=self.timeframe,
-            start=now - timedelta(days=self.days),
+            start=start,
             adjustment=Adjustment.ALL,
         )
 
-        print(f"\n📡 Fetching {self.timeframe} bars for {symbol if symbol else 'all securities'} over the last {self.days} days...")
+        if cached is not None:
+            print(f"\n📡 Fetching {self.timeframe} bars for all securities since {start}...")
+        else:
+            print(f"\n📡 Fetching {self.timeframe} bars for {label} over the last {self.days} days...")
 
         try:
-            df = self.client.get_stock_bars(request).df
+            bar_set = self.client.get_stock_bars(request)
+            # Columnar fast path; the SDK's own `.df` remains available on the BarSet for ad-hoc analysis
+            df = _bars_frame(bar_set) if hasattr(bar_set, "data") else bar_set.df
+
+            if cached is not None:
+                fetched_rows = len(df)
+                if not df.empty:
+                    df = pd.concat([cached, df])
+                    df = df[~df.index.duplicated(keep="last")]
+                    df = df[df.index.get_level_values("timestamp") >= window_start]
+                else:
+                    df = cached
 
             if df.empty:
                 print("❌ No data received. Check your API or market hours.")
                 return None
 
-            df = df.reset_index()
-            df = df.sort_values(by=["timestamp", "symbol"])
+            # Keep the (symbol, timestamp) MultiIndex so callers can slice a symbol with .xs();
+            # responses usually arrive in that order already, so only sort when they don't
+            if not df.index.is_monotonic_increasing:
+                df = df.sort_index()
 
-            print(f"✅ Successfully fetched {len(df)} rows of historical data for {symbol if symbol else 'all securities'}.")
+            if symbol is None:
+                self._bars_cache = df
+
+            if cached is not None:
+                print(f"✅ Successfully fetched {fetched_rows} new rows; {len(df)} rows cached for all securities.")
+            else:
+                print(f"✅ Successfully fetched {len(df)} rows of historical data for {label}.")
             return df
 
         except Exception as e:
             print(f"❌ Error fetching data: {e}")
             return None
+
+    def fetch_historical_data_batch(self, symbols):
+        """
+        Fetches bars for several symbols with a single request and splits them per symbol.
+        Symbols of the tracked universe are served from the incremental all-securities fetch (and its cache).
+
+        :param symbols: Symbols to fetch.
+        :return: dict of symbol -> DataFrame indexed by timestamp (symbols without bars are omitted),
+                 or None if the request failed.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        df = self.fetch_historical_data() if self._symbols_set.issuperset(symbols) else self.fetch_historical_data(symbols)
+        if df is None:
+            return None
+        available = df.index.unique(level="symbol")
+        return {symbol: df.xs(symbol, level="symbol") for symbol in symbols if symbol in available}
+
+    def get(self, symbol):
+        """
+        Cached bars of one symbol (indexed by timestamp) without a request, or None if none are cached.
+        """
+        if self._bars_cache is None or symbol not in self._bars_cache.index.unique(level="symbol"):
+            return None
+        return self._bars_cache.xs(symbol, level="symbol")
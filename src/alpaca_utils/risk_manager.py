@@ -1,5 +1,68 @@
+import hashlib
+import os
+import pickle
+import time
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def _wilder_atr(high, low, close, group, n_groups, alpha):
+    """
+    Latest ATR of each group of bars (e.g. one group per symbol, bars in chronological order within a group).
+
+    True range is computed on the fly and smoothed with the same recursion and rounding as
+    `Series.ewm(alpha=alpha, adjust=False).mean()`: seeded with the first true range, and a
+    bar with a missing true range decays the weight of the running average.
+
+    :param group: Group id (0 .. n_groups-1) of each bar.
+    :return: Array of the latest ATR of each group (NaN for groups without a valid true range).
+    """
+    old_wt_factor = 1.0 - alpha
+    atr = np.full(n_groups, np.nan)
+    old_wt = np.ones(n_groups)
+    previous_close = np.full(n_groups, np.nan)
+    seen = np.zeros(n_groups, dtype=np.bool_)
+
+    for i in range(len(high)):
+        g = group[i]
+        # True range (fmax semantics: the missing previous close of a group's first bar is ignored)
+        tr = np.fmax(high[i] - low[i], np.fmax(abs(high[i] - previous_close[g]), abs(low[i] - previous_close[g])))
+        previous_close[g] = close[i]
+
+        if not seen[g]:
+            seen[g] = True
+            atr[g] = tr
+        elif atr[g] == atr[g]:
+            old_wt[g] *= old_wt_factor
+            if tr == tr:
+                if atr[g] != tr:
+                    atr[g] = (old_wt[g] * atr[g] + alpha * tr) / (old_wt[g] + alpha)
+                old_wt[g] = 1.0
+        elif tr == tr:
+            atr[g] = tr
+    return atr
+
+@njit(cache=True)
+def _trade_levels(entry_price, atr, direction, atr_multiplier, risk_reward_ratio):
+    """
+    Stop loss, risk per share, and take profit of each trade as straight-line float math.
+
+    :param direction: +1.0 for BUY, -1.0 for SELL.
+    :return: (stop_loss, risk_per_share, take_profit) arrays.
+    """
+    n = len(entry_price)
+    stop_loss = np.empty(n)
+    risk_per_share = np.empty(n)
+    take_profit = np.empty(n)
+    for i in range(n):
+        # The 0.01 floor only binds for BUY stops: a SELL stop sits above a positive entry price
+        stop_loss[i] = max(entry_price[i] - direction[i] * atr[i] * atr_multiplier, 0.01)
+        risk_per_share[i] = direction[i] * (entry_price[i] - stop_loss[i])
+        take_profit[i] = entry_price[i] + direction[i] * risk_reward_ratio * risk_per_share[i]
+    return stop_loss, risk_per_share, take_profit
 
 class RiskManager:
     def __init__(
@@ -10,7 +73,10 @@ class RiskManager:
         risk_reward_ratio=2,
         max_position_fraction=0.01,  # e.g., 1% of buying power per trade
         max_open_positions=15,       # Max concurrent positions
-        max_notional_ratio=0.50      # Max 50% of buying power in positions
+        max_notional_ratio=0.50,     # Max 50% of buying power in positions
+        atr_cache_size=0,            # ATR results kept in memory (0 = off; enable for backtests/replays)
+        atr_cache_dir=None,          # e.g. "cache" to reuse ATR results across runs
+        atr_cache_ttl=86400          # Seconds a persisted ATR result stays valid
     ):
         """
         :param risk_per_trade: Fraction of equity to risk per trade (default = 0.01).
@@ -20,6 +86,10 @@ class RiskManager:
         :param max_position_fraction: Fraction of buying power allocated to one trade.
         :param max_open_positions: Maximum allowed open positions.
         :param max_notional_ratio: Maximum % of buying power allocated to total positions.
+        :param atr_cache_size: Number of ATR results kept in the in-memory LRU cache (0 = off). Live bars differ every
+            cycle, so only backtests and replays that revisit the same bars gain from it.
+        :param atr_cache_dir: Directory where ATR results are persisted as `<sha256>.pkl` (None = not persisted).
+        :param atr_cache_ttl: Age in seconds after which a persisted ATR result is recomputed.
         """
         self.risk_per_trade = risk_per_trade
         self.atr_period = atr_period
@@ -29,15 +99,90 @@ class RiskManager:
         self.max_open_positions = max_open_positions
         self.max_notional_ratio = max_notional_ratio
 
+        # ATR results keyed by a hash of the bars they were computed from (memory LRU, then disk)
+        self.atr_cache_size = atr_cache_size
+        self.atr_cache_dir = atr_cache_dir
+        self.atr_cache_ttl = atr_cache_ttl
+        self._atr_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _atr_key(self, *arrays) -> str:
+        """SHA-256 of the ATR period and the raw bytes of the input arrays."""
+        digest = hashlib.sha256(str(self.atr_period).encode())
+        for arr in arrays:
+            digest.update(np.ascontiguousarray(arr).tobytes())
+        return digest.hexdigest()
+
+    def _cached_atr(self, arrays, compute):
+        """Return the ATR result stored for `arrays`, or compute it with `compute()` and store it."""
+        if not self.atr_cache_size and not self.atr_cache_dir:
+            return compute()
+
+        key = self._atr_key(*arrays)
+        if key in self._atr_cache:
+            self._atr_cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._atr_cache[key]
+
+        result = None
+        path = os.path.join(self.atr_cache_dir, f"{key}.pkl") if self.atr_cache_dir else None
+        if path:
+            try:
+                if time.time() - os.path.getmtime(path) < self.atr_cache_ttl:
+                    with open(path, "rb") as f:
+                        result = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                result = None
+
+        if result is None:
+            self.cache_misses += 1
+            result = compute()
+            if path:
+                try:
+                    os.makedirs(self.atr_cache_dir, exist_ok=True)
+                    with open(path, "wb") as f:
+                        pickle.dump(result, f)
+                except OSError as e:
+                    print(f"⚠️ Could not persist ATR result: {e}")
+        else:
+            self.cache_hits += 1
+
+        if self.atr_cache_size:
+            self._atr_cache[key] = result
+            if len(self._atr_cache) > self.atr_cache_size:
+                self._atr_cache.popitem(last=False)
+        return result
+
     def compute_atr(self, df: pd.DataFrame) -> float:
         """Computes the Average True Range (ATR) using Wilder's smoothing."""
-        df = df.copy()
-        df["previous_close"] = df["close"].shift(1)
-        df["true_range"] = df[["high", "low", "previous_close"]].apply(
-            lambda row: max(row["high"] - row["low"], abs(row["high"] - row["previous_close"]), abs(row["low"] - row["previous_close"])), axis=1
+        high = df["high"].to_numpy(dtype=np.float64)
+        low = df["low"].to_numpy(dtype=np.float64)
+        close = df["close"].to_numpy(dtype=np.float64)
+        return self._cached_atr(
+            (high, low, close),
+            lambda: _wilder_atr(high, low, close, np.zeros(len(high), dtype=np.int64), 1, 1 / self.atr_period)[0],
         )
-        df["atr"] = df["true_range"].ewm(alpha=1/self.atr_period, adjust=False).mean()
-        return df["atr"].iloc[-1]
+
+    def compute_atr_batch(self, bars: pd.DataFrame) -> pd.Series:
+        """
+        Computes the latest ATR for every symbol of a (symbol, timestamp) indexed bars DataFrame.
+        True range and Wilder's smoothing run for all symbols in one compiled pass over the rows.
+
+        :return: Series of ATR values indexed by symbol.
+        """
+        codes, symbols = pd.factorize(bars.index.get_level_values("symbol"))
+        codes = codes.astype(np.int64)
+        high = bars["high"].to_numpy(dtype=np.float64)
+        low = bars["low"].to_numpy(dtype=np.float64)
+        close = bars["close"].to_numpy(dtype=np.float64)
+
+        def compute():
+            atr = _wilder_atr(high, low, close, codes, len(symbols), 1 / self.atr_period)
+            return pd.Series(atr, index=pd.Index(symbols, name="symbol")).sort_index()
+
+        arrays = (high, low, close, codes, "\0".join(map(str, symbols)).encode())
+        return self._cached_atr(arrays, compute).copy()
 
     def validate_portfolio_risk(self, account_info: dict, open_positions: list, proposed_trade_value: float):
         """
@@ -51,7 +196,9 @@ class RiskManager:
             return False
 
         # Check total notional risk
-        total_notional_open = sum(float(pos["market_value"]) for pos in open_positions)
+        # Market values (numbers or numeric strings) gathered into one array and reduced with NumPy
+        total_notional_open = float(np.fromiter((pos["market_value"] for pos in open_positions),
+                                                dtype=np.float64, count=len(open_positions)).sum())
         new_notional = total_notional_open + proposed_trade_value
         max_notional_allowed = account_info["buying_power"] * self.max_notional_ratio
 
@@ -61,6 +208,85 @@ class RiskManager:
 
         return True  # Trade is valid
 
+    def calculate_batch(
+        self,
+        atr: pd.Series,
+        entry_prices: pd.Series,
+        sides: pd.Series,
+        account_info: dict
+    ) -> pd.DataFrame:
+        """
+        Vectorized version of steps 1-4 of `calculate_trade_parameters` for several candidate trades.
+        Portfolio-level limits are not applied here: they depend on which trades are accepted first,
+        so each row is passed through `apply_portfolio_limits` in order.
+
+        :param atr: ATR per candidate, indexed like `entry_prices`.
+        :param entry_prices: Entry price per candidate (e.g. indexed by symbol).
+        :param sides: 'BUY' or 'SELL' per candidate, indexed like `entry_prices`.
+        :param account_info: Account details (equity, cash, buying power).
+        :return: DataFrame with one row per candidate and columns
+                 'side', 'entry_price', 'quantity', 'stop_loss', 'take_profit', 'atr'.
+        """
+        atr = atr.reindex(entry_prices.index).to_numpy(dtype=float)
+        side = sides.reindex(entry_prices.index).astype(str).str.upper().to_numpy()
+        entry_price = entry_prices.to_numpy(dtype=float)
+        is_buy = side == "BUY"
+        valid = (is_buy | (side == "SELL")) & (atr >= 1e-5)
+        direction = np.where(is_buy, 1.0, -1.0)
+
+        # Determine Stop Loss & Take Profit (BUY stops are floored at 0.01)
+        stop_loss, risk_per_share, take_profit = _trade_levels(
+            entry_price, atr, direction, float(self.atr_multiplier), float(self.risk_reward_ratio))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Risk-based quantity, capped by available funds (cash for BUY, buying power for SELL) and cash for BUY
+            quantity_risk_based = (account_info["equity"] * self.risk_per_trade) // risk_per_share
+            available_funds = np.where(is_buy, account_info["cash"], account_info["buying_power"])
+            quantity_notional_cap = (available_funds * self.max_position_fraction) // entry_price
+            quantity_cash_cap = np.where(is_buy, account_info["cash"] // entry_price, 999999)
+
+        quantity = np.minimum(np.minimum(quantity_risk_based, quantity_notional_cap), quantity_cash_cap)
+
+        return pd.DataFrame({
+            "side": side,
+            "entry_price": entry_price,
+            "quantity": np.where(valid, quantity, 0).astype(int),
+            "stop_loss": np.where(valid, stop_loss, np.nan),
+            "take_profit": np.where(valid, take_profit, np.nan),
+            "atr": atr,
+        }, index=entry_prices.index)
+
+    def apply_portfolio_limits(self, params: pd.Series, account_info: dict, open_positions: list):
+        """
+        Validates one row of `calculate_batch` against the portfolio-level constraints.
+
+        :param params: Row of the DataFrame returned by `calculate_batch`.
+        :param account_info: Account details (equity, cash, buying power).
+        :param open_positions: List of current open positions.
+        :return: dict with keys: 'quantity', 'stop_loss', 'take_profit', 'atr'.
+        """
+        atr = float(params["atr"])
+        if np.isnan(atr) or atr < 1e-5:
+            print("🚫 Skipping trade: ATR too low (market stagnant).")
+            return {"quantity": 0, "stop_loss": None, "take_profit": None, "atr": round(atr, 4)}
+
+        if params["side"] not in ("BUY", "SELL"):
+            print("🚫 Invalid trade side.")
+            return {"quantity": 0}
+
+        # Validate portfolio-level risk
+        quantity = int(params["quantity"])
+        proposed_trade_value = params["entry_price"] * quantity
+        if not self.validate_portfolio_risk(account_info, open_positions, proposed_trade_value):
+            return {"quantity": 0, "stop_loss": None, "take_profit": None, "atr": round(atr, 4)}
+
+        return {
+            "quantity": quantity,
+            "stop_loss": round(float(params["stop_loss"]), 2),
+            "take_profit": round(float(params["take_profit"]), 2),
+            "atr": round(atr, 4),
+        }
+
     def calculate_trade_parameters(
         self,
         df: pd.DataFrame,
@@ -76,6 +302,8 @@ class RiskManager:
         4. Ensures affordability for BUY trades (uses 'cash').
         5. Skips the trade if quantity <= 0 or portfolio constraints are violated.
 
+        Single-trade wrapper around `calculate_batch` and `apply_portfolio_limits`.
+
         :param df: DataFrame with 'high','low','close' columns.
         :param entry_price: Entry price for the trade.
         :param account_info: Account details (equity, cash, buying power).
@@ -83,48 +311,10 @@ class RiskManager:
         :param side: 'BUY' or 'SELL'.
         :return: dict with keys: 'quantity', 'stop_loss', 'take_profit', 'atr'.
         """
-        # Compute ATR
-        atr = self.compute_atr(df)
-        if np.isnan(atr) or atr < 1e-5:
-            print("🚫 Skipping trade: ATR too low (market stagnant).")
-            return {"quantity": 0, "stop_loss": None, "take_profit": None, "atr": round(atr, 4)}
-
-        # Determine Stop Loss & Take Profit
-        if side.upper() == "BUY":
-            stop_loss = max(entry_price - (atr * self.atr_multiplier), 0.01)  # Ensure SL is valid
-            risk_per_share = entry_price - stop_loss
-            take_profit = entry_price + (self.risk_reward_ratio * risk_per_share)
-        elif side.upper() == "SELL":
-            stop_loss = entry_price + (atr * self.atr_multiplier)
-            risk_per_share = stop_loss - entry_price
-            take_profit = entry_price - (self.risk_reward_ratio * risk_per_share)
-        else:
-            print("🚫 Invalid trade side.")
-            return {"quantity": 0}
-
-        # Compute risk-based quantity
-        risk_amount = account_info["equity"] * self.risk_per_trade
-        quantity_risk_based = int(risk_amount // risk_per_share)
-
-        # Determine Available Funds (Cash for BUY, Buying Power for SELL)
-        available_funds = account_info["cash"] if side.upper() == "BUY" else account_info["buying_power"]
-        max_notional = available_funds * self.max_position_fraction
-        quantity_notional_cap = int(max_notional // entry_price)
-
-        # Ensure BUY trades only use cash
-        quantity_cash_cap = int(account_info["cash"] // entry_price) if side.upper() == "BUY" else 999999
-
-        # Final quantity decision
-        final_quantity = min(quantity_risk_based, quantity_notional_cap, quantity_cash_cap)
-
-        # Validate portfolio-level risk
-        proposed_trade_value = entry_price * final_quantity
-        if not self.validate_portfolio_risk(account_info, open_positions, proposed_trade_value):
-            return {"quantity": 0, "stop_loss": None, "take_profit": None, "atr": round(atr, 4)}
-
-        return {
-            "quantity": final_quantity,
-            "stop_loss": round(stop_loss, 2),
-            "take_profit": round(take_profit, 2),
-            "atr": round(atr, 4),
-        }
\ No newline at end of file
+        params = self.calculate_batch(
+            atr=pd.Series([self.compute_atr(df)]),
+            entry_prices=pd.Series([entry_price]),
+            sides=pd.Series([side]),
+            account_info=account_info,
+        ).iloc[0]
+        return self.apply_portfolio_limits(params, account_info, open_positions)
@@ -1,5 +1,5 @@
-import os
-from dotenv import load_dotenv
+import time
+import threading
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import (
     MarketOrderRequest, LimitOrderRequest,
@@ -7,6 +7,7 @@ from alpaca.trading.requests import (
 )
 from alpaca.trading.enums import OrderSide, TimeInForce, OrderClass
 from alpaca.trading.requests import GetOrdersRequest
+from src.alpaca_utils.env import get_alpaca_credentials
 
 class TradeManager:
     """
@@ -14,22 +15,41 @@ class TradeManager:
     Supports market orders, stop orders, and bracket orders.
     """
 
-    def __init__(self, paper=True):
-        """Initialize the Alpaca Trading Client for executing trades."""
-        load_dotenv()
-
-        self.api_key = os.getenv("ALPACA_API_KEY")
-        self.secret_key = os.getenv("ALPACA_SECRET_KEY")
-
-        if not self.api_key or not self.secret_key:
-            raise ValueError("Missing API credentials. Ensure they are set in the .env file.")
+    def __init__(self, paper=True, account_ttl=0.5):
+        """
+        Initialize the Alpaca Trading Client for executing trades.
+        :param account_ttl: Seconds an account fetched for trade validation is reused, so orders
+                            submitted together share one `get_account` request.
+        """
+        self.api_key, self.secret_key = get_alpaca_credentials()
 
         self.client = TradingClient(self.api_key, self.secret_key, paper=paper)
 
-    def validate_trade(self, symbol, qty, side):
-        """Ensure sufficient buying power for BUY and allow SELL to open short if we don't hold shares."""
-        account = self.client.get_account()
-        buying_power = float(account.buying_power)
+        self.account_ttl = account_ttl
+        self._account = None
+        self._account_fetched_at = float("-inf")
+        self._account_lock = threading.Lock()  # Orders may be validated from several threads at once
+
+    def get_account(self):
+        """Returns the account, re-fetching it only when the cached one is older than `account_ttl`."""
+        with self._account_lock:
+            if time.monotonic() - self._account_fetched_at >= self.account_ttl:
+                self._account = self.client.get_account()
+                self._account_fetched_at = time.monotonic()
+            return self._account
+
+    def invalidate_account(self):
+        """Drops the cached account, so the next validation sees the buying power left after an order."""
+        with self._account_lock:
+            self._account_fetched_at = float("-inf")
+
+    def validate_trade(self, symbol, qty, side, buying_power=None):
+        """
+        Ensure sufficient buying power for BUY and allow SELL to open short if we don't hold shares.
+        :param buying_power: Buying power from an account snapshot the caller already holds (fetched if omitted).
+        """
+        if buying_power is None:
+            buying_power = float(self.get_account().buying_power)
 
         if side.lower() == "buy":
             # Check if we have enough buying power to go long
@@ -45,7 +65,7 @@ class TradeManager:
 
         return True
 
-    def place_market_order(self, symbol, qty, side, stop_loss_price=None, take_profit_price=None):
+    def place_market_order(self, symbol, qty, side, stop_loss_price=None, take_profit_price=None, buying_power=None):
         """
         Places a market order (buy/sell) with **bracket stop-loss and take-profit** orders.
 
@@ -54,28 +74,31 @@ class TradeManager:
         :param side: 'buy' or 'sell'
         :param stop_loss_price: Price at which to trigger stop loss (optional)
         :param take_profit_price: Price at which to take profit (optional)
+        :param buying_power: Buying power for validation from an existing account snapshot (optional)
         """
-        if not self.validate_trade(symbol, qty, side):
+        if not self.validate_trade(symbol, qty, side, buying_power):
             return None
 
         try:
             # ✅ Correct Bracket Order Handling
             order_class = OrderClass.BRACKET if stop_loss_price and take_profit_price else OrderClass.SIMPLE
 
+            # Side flag computed once; stop offsets move down (-1) for BUY and up (+1) for SELL
+            is_buy = side.lower() == "buy"
+            sign = -1 if is_buy else 1
+
             # ✅ Ensure Stop-Loss isn't too close
             if stop_loss_price:
                 min_sl_distance = stop_loss_price * 0.003  # 0.3% minimum distance
-                stop_price = max(stop_loss_price, stop_loss_price - min_sl_distance if side.lower() == "buy" else stop_loss_price + min_sl_distance)
-                stop_price = round(stop_price, 2)
-                stop_limit_offset = stop_price * 0.001  # 0.1% offset
-                stop_limit_price = round(stop_price - stop_limit_offset if side.lower() == "buy" else stop_price + stop_limit_offset, 2)
+                stop_price = round(max(stop_loss_price, stop_loss_price + sign * min_sl_distance), 2)
+                stop_limit_price = round(stop_price + sign * stop_price * 0.001, 2)  # 0.1% offset
             
             take_profit_price = round(take_profit_price, 2) if take_profit_price else None
 
             order = MarketOrderRequest(
                 symbol=symbol,
                 qty=qty,
-                side=OrderSide.BUY if side.lower() == "buy" else OrderSide.SELL,
+                side=OrderSide.BUY if is_buy else OrderSide.SELL,
                 time_in_force=TimeInForce.GTC,
                 order_class=order_class,
                 take_profit=TakeProfitRequest(limit_price=take_profit_price) if take_profit_price else None,
@@ -86,6 +109,7 @@ class TradeManager:
             )
 
             response = self.client.submit_order(order)
+            self.invalidate_account()
             print(f"✅ Market order placed: {side.upper()} {qty} shares of {symbol}")
 
             return response
@@ -95,7 +119,7 @@ class TradeManager:
             return None
 
 
-    def place_bracket_order(self, symbol, qty, side, limit_price, stop_loss_price, take_profit_price):
+    def place_bracket_order(self, symbol, qty, side, limit_price, stop_loss_price, take_profit_price, buying_power=None):
         """
         Places a **proper bracket order** (entry + stop-loss + take-profit).
         :param symbol: Stock ticker
@@ -104,8 +128,9 @@ class TradeManager:
         :param limit_price: Entry price
         :param stop_loss_price: Price at which to trigger stop loss
         :param take_profit_price: Price at which to take profit
+        :param buying_power: Buying power for validation from an existing account snapshot (optional)
         """
-        if not self.validate_trade(symbol, qty, side):
+        if not self.validate_trade(symbol, qty, side, buying_power):
             return None
 
         try:
@@ -121,6 +146,7 @@ class TradeManager:
             )
 
             response = self.client.submit_order(order)
+            self.invalidate_account()
             print(f"✅ Bracket order placed: {side.upper()} {qty} shares of {symbol} at ${limit_price}")
             return response
 
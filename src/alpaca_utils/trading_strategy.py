@@ -1,6 +1,61 @@
 import pandas as pd
 import numpy as np
-from collections import defaultdict, deque
+from enum import IntEnum
+from collections import defaultdict
+from numba import njit, prange
+
+from src.local_trading.indicator_core import pairwise_sum
+
+# Bar fields retained in the strategy buffers (column order of each buffer row)
+BUFFER_COLUMNS = ["open", "high", "low", "close", "volume", "vwap"]
+HIGH, LOW, CLOSE, VOLUME, VWAP = (BUFFER_COLUMNS.index(col) for col in ["high", "low", "close", "volume", "vwap"])
+
+# Bars read by the VWAP volume filter and CCI
+INDICATOR_WINDOW = 20
+
+# Spans of the incrementally maintained close EMAs (200 EMA, and the 9 / 26 EMA crossover)
+EMA_SPANS = np.array([200, 9, 26])
+EMA_DECAY = 1 - 2 / (EMA_SPANS + 1)
+
+@njit(cache=True, nogil=True, parallel=True, error_model="numpy")
+def _indicator_votes(tails, ema, out):
+    """
+    Indicator votes of every symbol as compiled code, one symbol per parallel iteration.
+
+    :param tails: (symbols x INDICATOR_WINDOW x BUFFER_COLUMNS) last bars of each symbol, NaN-left-padded.
+    :param ema: (symbols x 3) 200 / 9 / 26 EMAs of the closes (NaN before warm-up).
+    :param out: (symbols x 4) filled with 1 (bullish), -1 (bearish) or 0 for each indicator.
+    """
+    n = INDICATOR_WINDOW
+    for i in prange(tails.shape[0]):
+        latest_close = tails[i, n - 1, CLOSE]
+        latest_vwap = tails[i, n - 1, VWAP]
+
+        # 1️⃣ 200 EMA Indicator
+        ema_200 = ema[i, 0]
+        out[i, 0] = 0 if np.isnan(ema_200) else (1 if latest_close > ema_200 else -1)
+
+        # 2️⃣ VWAP + Volume Filter Indicator
+        volume_20_avg = pairwise_sum(tails[i, :, VOLUME]) / n
+        high_volume = tails[i, n - 1, VOLUME] > 0.8 * volume_20_avg
+        out[i, 1] = 1 if high_volume and latest_close > latest_vwap else (-1 if high_volume and latest_close < latest_vwap else 0)
+
+        # 3️⃣ CCI Indicator
+        typical_price = (tails[i, :, HIGH] + tails[i, :, LOW] + tails[i, :, CLOSE]) / 3
+        sma = pairwise_sum(typical_price) / n
+        mad = pairwise_sum(np.abs(typical_price - sma)) / n
+        cci = (typical_price[n - 1] - sma) / (0.015 * mad)
+        out[i, 2] = 1 if cci > 100 else (-1 if cci < -100 else 0)
+
+        # 4️⃣ EMA Crossover Indicator (9 EMA vs. 26 EMA)
+        ema_9, ema_26 = ema[i, 1], ema[i, 2]
+        out[i, 3] = 0 if np.isnan(ema_26) else (1 if ema_9 > ema_26 else -1)
+
+class Side(IntEnum):
+    """Trade signal produced by the strategy; HOLD is falsy so callers can branch with `if signal:`."""
+    HOLD = 0
+    BUY = 1
+    SELL = -1
 
 class TradingStrategy:
     """
@@ -10,71 +65,160 @@ class TradingStrategy:
       3. Commodity Channel Index (CCI)
       4. EMA Crossover
 
-    A trade signal ('BUY' or 'SELL') is generated if at least 3 out of 4 indicators agree.
+    A trade signal (Side.BUY or Side.SELL) is generated if at least 3 out of 4 indicators agree.
     """
 
-    def __init__(self):
+    def __init__(self, buffer_size=300):
         """Initializes the trading strategy."""
-        self.data_buffers = defaultdict(lambda: deque(maxlen=300))  # Store rolling market data for each symbol
+        self.buffer_size = buffer_size
+        # Store rolling market data for each symbol as a (bars x BUFFER_COLUMNS) float array: a view of the
+        # latest `buffer_size` rows of a preallocated (2*buffer_size x BUFFER_COLUMNS) store, so appending
+        # a bar writes one row and the kept rows are moved back to the front only once every buffer_size bars
+        self.data_buffers = defaultdict(lambda: np.empty((0, len(BUFFER_COLUMNS))))
+        self._stores = {}
+        self._store_end = {}
+        # Timestamp of the newest bar stored by `update_buffer_batch` for each symbol
+        self._last_ts = {}
+        # Buffer version per symbol, bumped whenever its bars change, and the last signal computed
+        # for each symbol as (version, side), so unchanged buffers are not re-evaluated
+        self._version = defaultdict(int)
+        self._signal_cache = {}
+        # Per symbol, the EMA_SPANS EMAs of the buffered closes as running sums (updated in O(1) per bar):
+        # row 0 = decay-weighted sum of the observed closes, row 1 = sum of their weights
+        self._ema_sums = defaultdict(lambda: np.zeros((2, len(EMA_SPANS))))
 
     def update_buffer(self, symbol, data_point):
         """Stores incoming market data for a given symbol."""
-        self.data_buffers[symbol].append(data_point)
+        row = np.array([[data_point.get(col, np.nan) for col in BUFFER_COLUMNS]], dtype=float)
+        self._append_rows(symbol, row)
 
-    def calculate_indicators(self, df):
-        """Computes four key indicators for trading decisions."""
-        df = df.copy()
-        df[['close', 'high', 'low', 'volume']] = df[['close', 'high', 'low', 'volume']].astype(float)
+    def update_buffer_batch(self, symbol, df):
+        """
+        Stores a block of market data for a given symbol in a single append.
+        Bars older than the last buffered timestamp are skipped, so a full window can be passed every cycle
+        and only new bars are appended. The last buffered bar is refreshed in case it was revised since.
 
-        if 'vwap' in df.columns:
-            df['vwap'] = df['vwap'].astype(float)
+        :param df: Bars for the symbol, indexed by timestamp in ascending order.
+        """
+        last_ts = self._last_ts.get(symbol)
+        if last_ts is not None:
+            df = df[df.index >= last_ts]
+            if len(df) and df.index[0] == last_ts:
+                latest = df.iloc[:1].reindex(columns=BUFFER_COLUMNS).to_numpy(dtype=float)
+                if not np.array_equal(self.data_buffers[symbol][-1:], latest, equal_nan=True):
+                    # The newest bar has weight 1 in every EMA sum, so its revision is a plain difference
+                    self._ema_sums[symbol] += _ema_terms(latest[0, CLOSE]) - _ema_terms(self.data_buffers[symbol][-1, CLOSE])
+                    self.data_buffers[symbol][-1] = latest
+                    self._version[symbol] += 1
+                df = df.iloc[1:]
 
-        # 1️⃣ 200 EMA Indicator
-        df["200_EMA"] = df['close'].ewm(span=200, min_periods=200).mean()
-        indicator1 = 0 if pd.isna(df["200_EMA"].iloc[-1]) else (1 if df['close'].iloc[-1] > df["200_EMA"].iloc[-1] else -1)
+        if len(df):
+            rows = df.reindex(columns=BUFFER_COLUMNS).to_numpy(dtype=float)[-self.buffer_size:]
+            self._append_rows(symbol, rows)
+            self._last_ts[symbol] = df.index[-1]
 
-        # 2️⃣ VWAP + Volume Filter Indicator
-        df["volume_20_avg"] = df['volume'].rolling(window=20).mean()
-        vwap_signal = 0
-        if 'vwap' in df.columns:
-            latest_close = df['close'].iloc[-1]
-            latest_vwap = df['vwap'].iloc[-1]
-            latest_volume = df['volume'].iloc[-1]
-            vol_avg = df["volume_20_avg"].iloc[-1]
-            if latest_close > latest_vwap and latest_volume > 0.8 * vol_avg:
-                vwap_signal = 1
-            elif latest_close < latest_vwap and latest_volume > 0.8 * vol_avg:
-                vwap_signal = -1
-        indicator2 = vwap_signal
+    def _append_rows(self, symbol, rows):
+        """
+        Appends rows to the symbol's buffer, keeping only the most recent `buffer_size` bars, and rolls
+        the EMA sums forward: every appended close enters with weight 1 after decaying the previous sum,
+        and every close pushed out of the window leaves with the weight decay**buffer_size it had reached.
+        """
+        previous = self.data_buffers[symbol]
+        closes = np.concatenate((previous[:, CLOSE], rows[:, CLOSE]))
+        n_new = len(rows)
+        added = closes[-n_new:]
+        dropped = closes[max(len(closes) - n_new - self.buffer_size, 0):max(len(closes) - self.buffer_size, 0)]
+        dropped = np.concatenate((np.full(n_new - len(dropped), np.nan), dropped))  # NaN = nothing dropped
 
-        # 3️⃣ CCI Indicator
-        df["typical_price"] = (df["high"] + df["low"] + df["close"]) / 3
-        sma = df["typical_price"].rolling(window=20).mean()
-        mad_vals = df["typical_price"].rolling(window=20).apply(lambda x: np.abs(x - x.mean()).mean(), raw=True)
-        cci = (df["typical_price"] - sma) / (0.015 * mad_vals)
-        indicator3 = 0 if np.isnan(cci.iloc[-1]) else (1 if cci.iloc[-1] > 100 else (-1 if cci.iloc[-1] < -100 else 0))
+        # Weight of each of the block's bars once the whole block is in: decay**(bars after it)
+        weights = EMA_DECAY[:, None] ** np.arange(n_new - 1, -1, -1)
+        self._ema_sums[symbol] = (EMA_DECAY ** n_new * self._ema_sums[symbol]
+                                  + _ema_terms(added) @ weights.T
+                                  - EMA_DECAY ** self.buffer_size * (_ema_terms(dropped) @ weights.T))
 
-        # 4️⃣ EMA Crossover Indicator (9 EMA vs. 26 EMA)
-        df["9_EMA"] = df['close'].ewm(span=9, min_periods=9).mean()
-        df["26_EMA"] = df['close'].ewm(span=26, min_periods=26).mean()
-        indicator4 = 0 if pd.isna(df["26_EMA"].iloc[-1]) else (1 if df["9_EMA"].iloc[-1] > df["26_EMA"].iloc[-1] else -1)
+        self.data_buffers[symbol] = self._write_rows(symbol, previous, rows[-self.buffer_size:])
+        self._version[symbol] += 1
+
+    def _write_rows(self, symbol, previous, rows):
+        """Writes rows after `previous` in the symbol's store and returns the view of its latest `buffer_size` rows."""
+        store = self._stores.get(symbol)
+        if store is None:
+            store = self._stores[symbol] = np.empty((2 * self.buffer_size, len(BUFFER_COLUMNS)))
+        end = self._store_end.get(symbol, 0)
+
+        kept = min(len(previous), self.buffer_size - len(rows))
+        if end + len(rows) > len(store):
+            store[:kept] = store[end - kept:end]  # Move the rows still in the window back to the front
+            end = kept
+        store[end:end + len(rows)] = rows
+        end += len(rows)
+
+        self._store_end[symbol] = end
+        return store[end - kept - len(rows):end]
+
+    def calculate_indicators(self, symbols):
+        """
+        Computes the four key indicators for a batch of symbols in one compiled pass (`_indicator_votes`).
+        Only the last 20 bars of each buffer are gathered, since that is all the VWAP volume filter and CCI read;
+        EMAs are read from the running sums kept by `_append_rows` rather than recomputed over the buffer.
+
+        :param symbols: Symbols to evaluate, each holding at least 20 bars.
+        :return: (symbols x 4) int array of indicator votes (1 = bullish, -1 = bearish, 0 = neutral).
+        """
+        buffers = [self.data_buffers[symbol] for symbol in symbols]
+        tails = np.full((len(buffers), INDICATOR_WINDOW, len(BUFFER_COLUMNS)), np.nan)
+        for i, buffer in enumerate(buffers):
+            tail = buffer[-INDICATOR_WINDOW:]
+            tails[i, INDICATOR_WINDOW - len(tail):] = tail
 
-        return indicator1, indicator2, indicator3, indicator4
+        # EMAs of the buffered closes (adjust=True, NaN until `span` closes are observed)
+        ema_sums = np.stack([self._ema_sums[symbol] for symbol in symbols])
+        observed = np.array([np.count_nonzero(~np.isnan(buffer[:, CLOSE])) for buffer in buffers])
+        ema = np.where(observed[:, None] >= EMA_SPANS, ema_sums[:, 0] / ema_sums[:, 1], np.nan)
+
+        votes = np.empty((len(buffers), 4), dtype=np.int64)
+        _indicator_votes(tails, ema, votes)
+        return votes
+
+    def generate_signals_vectorized(self, symbols):
+        """
+        Determines whether to BUY, SELL, or HOLD every given symbol based on indicator agreement.
+        Symbols with fewer than 200 buffered bars are held without being evaluated, and symbols whose
+        buffer hasn't changed since their last evaluation reuse the cached signal.
+
+        :param symbols: Symbols whose buffers should be evaluated.
+        :return: Series of Side values indexed by symbol.
+        """
+        signals = dict.fromkeys(symbols, Side.HOLD)
+        stale = []
+        for symbol in signals:
+            if len(self.data_buffers[symbol]) < 200:
+                continue
+            cached = self._signal_cache.get(symbol)
+            if cached is not None and cached[0] == self._version[symbol]:
+                signals[symbol] = cached[1]
+            else:
+                stale.append(symbol)
+
+        if stale:
+            votes = self.calculate_indicators(stale)
+            buy_signals = (votes == 1).sum(axis=1)
+            sell_signals = (votes == -1).sum(axis=1)
+
+            sides = np.where(buy_signals >= 3, Side.BUY, np.where(sell_signals >= 3, Side.SELL, Side.HOLD))
+            for symbol, side in zip(stale, sides.tolist()):
+                signals[symbol] = Side(side)
+                self._signal_cache[symbol] = (self._version[symbol], signals[symbol])
+
+        return pd.Series(signals, index=list(signals), dtype=object)
 
     def generate_trade_signal(self, symbol):
-        """Determines whether to 'BUY', 'SELL', or hold based on indicator agreement."""
-        if len(self.data_buffers[symbol]) < 200:
-            return None  # Not enough data
-
-        df = pd.DataFrame(list(self.data_buffers[symbol]))
-        ind1, ind2, ind3, ind4 = self.calculate_indicators(df)
-
-        buy_signals = sum(1 for i in [ind1, ind2, ind3, ind4] if i == 1)
-        sell_signals = sum(1 for i in [ind1, ind2, ind3, ind4] if i == -1)
-
-        if buy_signals >= 3:
-            return 'BUY'
-        elif sell_signals >= 3:
-            return 'SELL'
-        else:
-            return None
\ No newline at end of file
+        """Determines whether to BUY, SELL, or HOLD a single symbol based on indicator agreement."""
+        return self.generate_signals_vectorized([symbol])[symbol]
+
+
+def _ema_terms(closes):
+    """(2 x n) EMA sum terms of closes: the close (0 if missing) and whether it was observed."""
+    closes = np.atleast_1d(closes)
+    observed = ~np.isnan(closes)
+    return np.stack((np.where(observed, closes, 0.0), observed.astype(float)))
@@ -5,25 +5,57 @@ import csv
 import pandas as pd
 import numpy as np
 from three_strategy_client import TradingStrategy, PortfolioManager
+from portfolio_core import step, HOLD, BUY, SELL
 
 # ------------------------
 # Configurable Parameters
 # ------------------------
 DATA_PATH = "./data/historical_stock_data_15min_1year.csv"  # Adjust if needed
 RESULTS_PATH = "./data/backtest_results.csv"
+TRADES_PATH = "./data/backtest_trades.csv"
+# Parsed, typed and sorted copy of DATA_PATH; rebuilt whenever the CSV is newer
+CACHE_PATH = DATA_PATH.replace(".csv", ".pkl")
 
-# Print progress every N rows
+# Column dtypes applied while parsing the CSV
+CSV_DTYPES = {"symbol": "category", "open": "float64", "high": "float64", "low": "float64",
+              "close": "float64", "volume": "float64"}
+
+# Print progress (and flush results) every N rows
 PRINT_EVERY = 5000
 
+# Print every signal generated in the first 5000 rows (debugging aid; slow on a terminal)
+VERBOSE = False
+
+# Write buffer for the results CSV (1 MiB)
+WRITE_BUFFER_SIZE = 1 << 20
+
 # ------------------------
-# Main Backtest Function
+# Helpers
 # ------------------------
-def main():
-    if not os.path.exists(DATA_PATH):
-        raise FileNotFoundError(f"❌ CSV not found at {DATA_PATH}")
+def round_cents(values):
+    """
+    Rounds a float array to 2 decimals in bulk, giving the same results as Python's round(x, 2).
+    np.round scales by 100 first, which can tip values sitting on a half cent; those few are re-rounded in Python.
+    """
+    rounded = np.round(values, 2)
+    ties = np.flatnonzero(np.abs(np.abs(values * 100) % 1 - 0.5) < 1e-6)
+    rounded[ties] = [round(v, 2) for v in values[ties].tolist()]
+    return rounded
+
+# ------------------------
+# Data Loading
+# ------------------------
+def load_data():
+    """
+    Loads the backtest bars sorted by (timestamp, symbol).
+    The CSV is parsed once and cached as a pickle; later runs load the cache unless the CSV has changed.
+    """
+    if os.path.exists(CACHE_PATH) and os.path.getmtime(CACHE_PATH) >= os.path.getmtime(DATA_PATH):
+        print(f"✅ Loading cached backtest data from: {CACHE_PATH}")
+        return pd.read_pickle(CACHE_PATH)
 
     print(f"✅ Loading backtest data from: {DATA_PATH}")
-    df = pd.read_csv(DATA_PATH)
+    df = pd.read_csv(DATA_PATH, dtype=CSV_DTYPES)
     if df.empty:
         raise ValueError("❌ The CSV file is empty. Cannot run backtest.")
 
@@ -34,56 +66,73 @@ def main():
     df["timestamp"] = pd.to_datetime(df["timestamp"])
     df = df.sort_values(by=["timestamp", "symbol"]).reset_index(drop=True)
 
+    df.to_pickle(CACHE_PATH)
+    return df
+
+# ------------------------
+# Main Backtest Function
+# ------------------------
+def main():
+    if not os.path.exists(DATA_PATH):
+        raise FileNotFoundError(f"❌ CSV not found at {DATA_PATH}")
+
+    df = load_data()
+
     print(f"🚀 Running backtest on {len(df)} rows...")
 
     # Initialize strategy & portfolio
     strategy = TradingStrategy()
     portfolio = PortfolioManager()
 
+    # Signals for every row are computed up front in one vectorized pass
+    signals = strategy.generate_signals_vectorized(df)
+    signal_codes = signals.map({"BUY": BUY, "SELL": SELL}).fillna(HOLD).to_numpy(dtype=np.int64)
+
+    # The portfolio state machine runs as compiled code over parallel column arrays, extracted once.
+    # `symbol` is categorical (see CSV_DTYPES), so its codes already are integer symbol ids.
+    symbol_ids = df["symbol"].cat.codes.to_numpy(dtype=np.int64)
+    symbols = df["symbol"].cat.categories.to_numpy()
+    prices = df["close"].to_numpy(dtype=float)
+    timestamps = df["timestamp"].to_numpy(dtype=object)
+    (cash, total_values, unrealized, positions_held,
+     trade_rows, trade_symbols, trade_actions, trade_prices, trade_qtys) = step(
+        symbol_ids, prices, signal_codes, len(symbols), portfolio.cash
+    )
+
+    # Debug: Only print when signal is generated
+    if VERBOSE:
+        for i in np.flatnonzero(signal_codes[:4999]):
+            print(f"{i + 1} -> {signals[i]}, {symbols[symbol_ids[i]]}, ${prices[i]:.2f}, cash={cash[i]}")
+
     # Prepare CSV logging
-    # We'll write each row as we go so we can track partial progress.
-    with open(RESULTS_PATH, "w", newline="") as f:
+    # A single buffered handle is held for the whole write; it is flushed with each progress print.
+    with open(RESULTS_PATH, "w", newline="", buffering=WRITE_BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(["Timestamp", "TotalValue", "UnrealizedPnL", "PositionsHeld"])
 
-    # Main loop
-    for i, row in enumerate(df.itertuples(index=False), start=1):
-        # Convert to dict for the strategy
-        market_data = row._asdict()
-
-        # Update strategy buffers & generate signals
-        strategy.update_buffers(market_data["symbol"], market_data)
-        signal = strategy.generate_signal(market_data["symbol"], market_data)
-
-        if signal:
-            price = float(market_data["close"])
-            # Execute trade
-            portfolio.execute_trade(market_data["symbol"], signal, price, market_data["timestamp"])
-            
-            # Debug: Only print when signal is generated
-            if i < 5000:
-                print(f"{i} -> {signal}, {market_data['symbol']}, ${price:.2f}, cash={portfolio.cash}")
-
-        # Update portfolio valuation
-        total_value, unrealized = portfolio.update_valuation(market_data["timestamp"], [market_data])
-
-        # Write partial result to CSV
-        with open(RESULTS_PATH, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                market_data["timestamp"],
-                round(total_value, 2),
-                round(unrealized, 2),
-                len(portfolio.positions)
-            ])
-
-        # Print progress occasionally
-        if i % PRINT_EVERY == 0:
-            print(f"...processed {i} rows so far. Current TotalValue={round(total_value,2)}")
-
+        # Values are rounded to cents in bulk and written PRINT_EVERY rows at a time
+        rows = list(zip(timestamps.tolist(), round_cents(total_values).tolist(), round_cents(unrealized).tolist(), positions_held.tolist()))
+        for start in range(0, len(rows), PRINT_EVERY):
+            end = start + PRINT_EVERY
+            writer.writerows(rows[start:end])
+
+            # Print progress occasionally
+            if end <= len(rows):
+                f.flush()
+                print(f"...processed {end} rows so far. Current TotalValue={rows[end - 1][1]}")
+
+    # Trade log collected by the compiled loop
+    pd.DataFrame({
+        "Timestamp": timestamps[trade_rows],
+        "Symbol": symbols[trade_symbols],
+        "Action": np.where(trade_actions == BUY, "BUY", "SELL"),
+        "Price": trade_prices,
+        "Quantity": trade_qtys,
+    }).to_csv(TRADES_PATH, index=False)
 
     print(f"\n✅ Backtest Complete! Processed {len(df)} rows in total.")
     print(f"📊 Results saved to: {RESULTS_PATH}")
+    print(f"🧾 {len(trade_rows)} trades saved to: {TRADES_PATH}")
 
 # ------------------------
 # Entry Point
@@ -1,23 +1,74 @@
 #!/usr/bin/env python3
 
 import socket
-import json
 import csv
-from collections import defaultdict, deque
+from collections import defaultdict
 import os
+import logging
 
-import pandas as pd
 import numpy as np
 
 from numba import jit
-from pandarallel import pandarallel
 
-# Initialize pandarallel AFTER defining mad()
-@jit(nopython=True)
-def mad(x):
-    return np.mean(np.abs(x - np.mean(x)))
+from message_stream import read_lines, loads, JSONDecodeError, set_nodelay, set_receive_buffer
 
-pandarallel.initialize(progress_bar=True)
+# Per-tick buffer/indicator messages are logged at DEBUG; run with logging.DEBUG to see them
+log = logging.getLogger(__name__)
+
+# Commodity Channel Index of a single window (used for the live signal)
+# error_model='numpy' keeps a zero mean deviation returning inf/nan instead of raising
+@jit(nopython=True, error_model='numpy')
+def cci(typical_price, latest):
+    """CCI of the latest typical price over a window of typical prices (any order)."""
+    sma = np.mean(typical_price)
+    return (latest - sma) / (0.015 * np.mean(np.abs(typical_price - sma)))
+
+# Window (bars) of the CCI and volume average
+CCI_WINDOW = 20
+
+# EMA spans maintained incrementally per symbol
+EMA_SPANS = (9, 26, 200)
+
+class RingBuffer:
+    """
+    Fixed-capacity circular buffer of bars, stored as one preallocated float array per field.
+    Missing fields (e.g. no 'vwap') are stored as NaN.
+    """
+    FIELDS = ('close', 'high', 'low', 'volume', 'vwap')
+
+    def __init__(self, capacity=300):
+        self.capacity = capacity
+        self.arrays = {field: np.empty(capacity) for field in self.FIELDS}
+        self.head = 0  # Next write position
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, data_point):
+        """Write one bar, overwriting the oldest once full. Returns the evicted close, or None."""
+        evicted = self.arrays['close'][self.head] if self.count == self.capacity else None
+        for field, arr in self.arrays.items():
+            value = data_point.get(field)
+            arr[self.head] = np.nan if value is None else float(value)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return evicted
+
+    def get(self, field, age=0):
+        """Value of `field` from `age` bars ago (0 = latest)."""
+        return self.arrays[field][(self.head - 1 - age) % self.capacity]
+
+    def tail(self, field, n):
+        """Last `n` values of `field`, oldest first."""
+        return self.arrays[field][np.arange(self.head - n, self.head) % self.capacity]
+
+    def as_array(self, field):
+        """All buffered values of `field` as a contiguous array, oldest first."""
+        arr = self.arrays[field]
+        if self.count < self.capacity:
+            return arr[:self.count].copy()
+        return np.concatenate((arr[self.head:], arr[:self.head]))
 
 class TradingStrategy:
     """
@@ -31,41 +82,77 @@ class TradingStrategy:
     """
     def __init__(self, risk_amount=1.0):
         # Store a rolling window of market data for each symbol
-        self.data_buffers = defaultdict(lambda: deque(maxlen=300))
+        self.data_buffers = defaultdict(lambda: RingBuffer(capacity=300))
         self.risk_amount = risk_amount
-        
+        # Incremental indicator state, updated in O(1) as each bar is appended:
+        # decayed close sums over the buffer window for each EMA span, and the 20-bar volume sum
+        self.ema = defaultdict(lambda: dict.fromkeys(EMA_SPANS, 0.0))
+        self.volume_sum = defaultdict(float)
+        # Typical price of the last CCI_WINDOW bars per symbol, written in place as a circular array.
+        self.typical_price = defaultdict(lambda: np.empty(CCI_WINDOW))
+        # Next write slot of each symbol's typical-price ring (independent of the bar buffer's capacity)
+        self.typical_head = defaultdict(int)
 
     def update_buffer(self, symbol, data_point):
         """Append the latest market data point to the symbol's buffer."""
-        self.data_buffers[symbol].append(data_point)
-        print(f"Buffer updated for {symbol}: now {len(self.data_buffers[symbol])} data points")
-
-    def calculate_indicators(self, df):
-        # Convert necessary columns to float
-        df['close'] = df['close'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-        
-        # If 'vwap' exists, convert it to float as well
-        if 'vwap' in df.columns:
-            df['vwap'] = df['vwap'].astype(float)
+        buffer = self.data_buffers[symbol]
+        evicted = buffer.append(data_point)
+
+        # EMA_t = close_t + decay * EMA_{t-1}, minus the close that just left the window
+        close = buffer.get('close')
+        ema = self.ema[symbol]
+        for span in EMA_SPANS:
+            decay = 1 - 2 / (span + 1)
+            ema[span] = close + decay * ema[span]
+            if evicted is not None:
+                ema[span] -= decay ** buffer.capacity * evicted
+
+        # Running 20-bar volume sum
+        volume_sum = self.volume_sum[symbol] + buffer.get('volume')
+        if len(buffer) > CCI_WINDOW:
+            volume_sum -= buffer.get('volume', CCI_WINDOW)
+        if not np.isfinite(volume_sum):
+            # A missing (NaN) volume would otherwise poison the running sum for good; rebuild it from the
+            # window instead, so it is NaN only while that bar is among the last CCI_WINDOW (like rolling().mean())
+            volume_sum = float(buffer.tail('volume', min(len(buffer), CCI_WINDOW)).sum())
+        self.volume_sum[symbol] = volume_sum
+
+        # Typical price of this bar, overwriting the one from CCI_WINDOW bars ago
+        slot = self.typical_head[symbol]
+        self.typical_price[symbol][slot] = (buffer.get('high') + buffer.get('low') + close) / 3
+        self.typical_head[symbol] = (slot + 1) % CCI_WINDOW
+
+        log.debug("Buffer updated for %s: now %d data points", symbol, len(buffer))
+
+    def ema_value(self, symbol, span):
+        """
+        Latest `ewm(span=span, min_periods=span).mean()` of the buffered closes.
+        With adjust=True the EMA is the decayed close sum normalised by the sum of its weights.
+        """
+        n = len(self.data_buffers[symbol])
+        if n < span:
+            return np.nan
+        decay = 1 - 2 / (span + 1)
+        return self.ema[symbol][span] * (1 - decay) / (1 - decay ** n)
+
+    def calculate_indicators(self, symbol):
+        # All four indicators read the incremental EMA / volume / typical-price state; no window is rebuilt
+        buffer = self.data_buffers[symbol]
+        latest_close = buffer.get('close')
 
         # 1. 200 EMA Indicator
-        df["200_EMA"] = df['close'].ewm(span=200, min_periods=200).mean()
-        if pd.isna(df["200_EMA"].iloc[-1]):
+        ema_200 = self.ema_value(symbol, 200)
+        if np.isnan(ema_200):
             indicator1 = 0  # Treat as neutral if EMA not available
         else:
-            indicator1 = 1 if df['close'].iloc[-1] > df["200_EMA"].iloc[-1] else -1
+            indicator1 = 1 if latest_close > ema_200 else -1
 
         # 2. VWAP + Volume Filter Indicator
-        df["volume_20_avg"] = df['volume'].rolling(window=20).mean()
         vwap_signal = 0
-        if 'vwap' in df.columns:
-            latest_close = df['close'].iloc[-1]
-            latest_vwap = df['vwap'].iloc[-1]
-            latest_volume = df['volume'].iloc[-1]
-            vol_avg = df["volume_20_avg"].iloc[-1]
+        latest_vwap = buffer.get('vwap')
+        if not np.isnan(latest_vwap):
+            latest_volume = buffer.get('volume')
+            vol_avg = self.volume_sum[symbol] / CCI_WINDOW if len(buffer) >= CCI_WINDOW else np.nan
             if latest_close > latest_vwap and latest_volume > 0.8 * vol_avg:
                 vwap_signal = 1
             elif latest_close < latest_vwap and latest_volume > 0.8 * vol_avg:
@@ -73,29 +160,29 @@ class TradingStrategy:
         indicator2 = vwap_signal
 
         # 3. CCI Indicator
-        df["typical_price"] = (df["high"] + df["low"] + df["close"]) / 3
-        sma = df["typical_price"].rolling(window=20).mean()
-        mad_vals = df["typical_price"].rolling(window=20).apply(lambda x: np.abs(x - x.mean()).mean(), raw=True)
-        cci = (df["typical_price"] - sma) / (0.015 * mad_vals)
         cci_signal = 0
-        if not np.isnan(cci.iloc[-1]):
-            if cci.iloc[-1] > 100:
-                cci_signal = 1
-            elif cci.iloc[-1] < -100:
-                cci_signal = -1
-            else:
-                cci_signal = 0
+        if len(buffer) >= CCI_WINDOW:
+            typical_price = self.typical_price[symbol]
+            cci_value = cci(typical_price, typical_price[(self.typical_head[symbol] - 1) % CCI_WINDOW])
+            if not np.isnan(cci_value):
+                if cci_value > 100:
+                    cci_signal = 1
+                elif cci_value < -100:
+                    cci_signal = -1
+                else:
+                    cci_signal = 0
         indicator3 = cci_signal
 
         # 4. EMA Crossover Indicator (9 EMA vs. 26 EMA)
-        df["9_EMA"] = df['close'].ewm(span=9, min_periods=9).mean()
-        df["26_EMA"] = df['close'].ewm(span=26, min_periods=26).mean()
-        if pd.isna(df["26_EMA"].iloc[-1]):
+        ema_9 = self.ema_value(symbol, 9)
+        ema_26 = self.ema_value(symbol, 26)
+        if np.isnan(ema_26):
             indicator4 = 0  # Neutral if 26 EMA not available
         else:
-            indicator4 = 1 if df["9_EMA"].iloc[-1] > df["26_EMA"].iloc[-1] else -1
+            indicator4 = 1 if ema_9 > ema_26 else -1
 
-        print(f"Indicators computed: 200 EMA signal: {indicator1}, VWAP signal: {indicator2}, CCI signal: {indicator3}, EMA crossover: {indicator4}")
+        log.debug("Indicators computed: 200 EMA signal: %s, VWAP signal: %s, CCI signal: %s, EMA crossover: %s",
+                  indicator1, indicator2, indicator3, indicator4)
         return indicator1, indicator2, indicator3, indicator4
 
     def generate_trade_signal(self, symbol):
@@ -105,10 +192,9 @@ class TradingStrategy:
         """
         # Lowered threshold to 200 data points (adjust as needed)
         if len(self.data_buffers[symbol]) < 200:
-            print(f"Insufficient data for {symbol}: {len(self.data_buffers[symbol])} points")
+            log.debug("Insufficient data for %s: %d points", symbol, len(self.data_buffers[symbol]))
             return None
-        df = pd.DataFrame(list(self.data_buffers[symbol]))
-        ind1, ind2, ind3, ind4 = self.calculate_indicators(df)
+        ind1, ind2, ind3, ind4 = self.calculate_indicators(symbol)
         signals = [ind1, ind2, ind3, ind4]
         buy_signals = sum(1 for s in signals if s == 1)
         sell_signals = sum(1 for s in signals if s == -1)
@@ -135,16 +221,25 @@ class PortfolioManager:
     """
     def __init__(self, risk_amount=1.0):
         self.cash = 100000.0
-        self.positions = {}  # symbol -> { 'entry_price': float, 'position_type': str, 'stop_loss': float, 'target': float, 'quantity': int }
+        # Positions are stored as parallel arrays indexed by symbol id; ids are assigned on first sight
+        self.sym_id = {}  # symbol -> row in the position arrays
+        self.symbols = []  # row -> symbol
+        self.open_mask = np.zeros(0, dtype=bool)
+        self.sign = np.zeros(0)       # +1 long, -1 short
+        self.qty = np.zeros(0)
+        self.entry = np.zeros(0)
+        self.stop_loss = np.zeros(0)
+        self.target = np.zeros(0)
         self.realized_pnl = 0.0
         self.risk_amount = risk_amount
         # File to log executed trades
         self.trade_log_file = 'data/trade_execution_log.csv'
         os.makedirs(os.path.dirname(self.trade_log_file), exist_ok=True)
-        # Initialize the CSV with headers
-        with open(self.trade_log_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Timestamp', 'Symbol', 'Action', 'Price', 'Quantity', 'Realized_PNL'])
+        # Keep the trade log open for the whole session and initialize it with headers
+        self._trade_fh = open(self.trade_log_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE)
+        self._trade_writer = csv.writer(self._trade_fh)
+        self._trade_writer.writerow(['Timestamp', 'Symbol', 'Action', 'Price', 'Quantity', 'Realized_PNL'])
+        self._trade_rows = 0
 
     def log_trade_event(self, timestamp, symbol, action, price, quantity, pnl):
         """
@@ -153,14 +248,40 @@ class PortfolioManager:
         For exit trades, the realized pnl is recorded.
         """
         try:
-            with open(self.trade_log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, symbol, action, price, quantity, pnl])
+            self._trade_writer.writerow([timestamp, symbol, action, price, quantity, pnl])
+            self._trade_rows += 1
+            if self._trade_rows % FLUSH_EVERY == 0:
+                self._trade_fh.flush()
         except Exception as e: 
             print(f"Error logging trade event: {e}")
 
+    def close(self):
+        """Flush and close the trade log file."""
+        self._trade_fh.close()
+
+    def _symbol_index(self, symbol):
+        """Return the array row for `symbol`, growing the position arrays when a new symbol appears."""
+        idx = self.sym_id.get(symbol)
+        if idx is None:
+            idx = self.sym_id[symbol] = len(self.sym_id)
+            self.symbols.append(symbol)
+            if idx == len(self.open_mask):
+                grow = max(len(self.open_mask), 16)
+                self.open_mask = np.concatenate((self.open_mask, np.zeros(grow, dtype=bool)))
+                for name in ('sign', 'qty', 'entry', 'stop_loss', 'target'):
+                    setattr(self, name, np.concatenate((getattr(self, name), np.zeros(grow))))
+        return idx
+
+    def has_position(self, symbol):
+        idx = self.sym_id.get(symbol)
+        return idx is not None and self.open_mask[idx]
+
+    @property
+    def open_count(self):
+        return int(np.count_nonzero(self.open_mask))
+
     def open_position(self, symbol, signal, current_price, timestamp, is_stock=True):
-        if symbol in self.positions:
+        if self.has_position(symbol):
             return  # Position already open
 
         position_type = signal  # 'BUY' for long, 'SELL' for short
@@ -182,42 +303,47 @@ class PortfolioManager:
             stop_loss = current_price + self.risk_amount
             target = current_price - profit_ratio * self.risk_amount
 
-        self.positions[symbol] = {
-            'entry_price': current_price,
-            'position_type': position_type,
-            'stop_loss': stop_loss,
-            'target': target,
-            'quantity': quantity
-        }
+        idx = self._symbol_index(symbol)
+        self.open_mask[idx] = True
+        self.sign[idx] = 1.0 if position_type == 'BUY' else -1.0
+        self.qty[idx] = quantity
+        self.entry[idx] = current_price
+        self.stop_loss[idx] = stop_loss
+        self.target[idx] = target
         print(f"Opened {position_type} position for {symbol} at {current_price:.2f} | SL: {stop_loss:.2f} | Target: {target:.2f}")
         self.log_trade_event(timestamp, symbol, f'OPEN {position_type}', current_price, quantity, 'N/A')
 
-    def update_positions(self, symbol, current_price, timestamp):
-        if symbol not in self.positions:
-            return
+    def price_vector(self, market_data):
+        """Close price of every tracked symbol in `market_data`, indexed by symbol id (NaN where missing)."""
+        price_vec = np.full(len(self.open_mask), np.nan)
+        known = [(self.sym_id[d['symbol']], float(d['close'])) for d in market_data if d['symbol'] in self.sym_id]
+        if known:
+            ids, closes = zip(*known)
+            price_vec[list(ids)] = closes
+        return price_vec
 
-        pos = self.positions[symbol]
-        entry = pos['entry_price']
-        action = pos['position_type']
-        quantity = pos['quantity']
-
-        # Determine exit condition
-        exit_condition = False
-        if action == 'BUY':
-            if current_price >= pos['target'] or current_price <= pos['stop_loss']:
-                exit_condition = True
-        else:
-            if current_price <= pos['target'] or current_price >= pos['stop_loss']:
-                exit_condition = True
-
-        if exit_condition:
-            # Calculate PNL and adjust cash
-            if action == 'BUY':
-                self.cash += current_price * quantity  # Sell the position
-                pnl = (current_price - entry) * quantity
-            else:
-                self.cash -= current_price * quantity  # Buy back the short
-                pnl = (entry - current_price) * quantity
+    def update_positions(self, timestamp, price_vec):
+        """
+        Closes every open position whose target or stop was hit at this bar's prices.
+        All positions are checked at once; only the exits are handled one by one.
+        """
+        # Exit once price reaches the target or crosses the stop, measured in the position's direction
+        # (comparisons against a NaN price are False, so symbols missing from this bar are kept)
+        with np.errstate(invalid='ignore'):
+            hit_target = self.sign * (price_vec - self.target) >= 0
+            hit_stop = self.sign * (price_vec - self.stop_loss) <= 0
+        exit_mask = self.open_mask & (hit_target | hit_stop)
+
+        for idx in np.flatnonzero(exit_mask):
+            symbol = self.symbols[idx]
+            sign = self.sign[idx]
+            current_price = price_vec[idx]
+            quantity = int(self.qty[idx])
+            action = 'BUY' if sign > 0 else 'SELL'
+
+            # Calculate PNL and adjust cash (sell the long / buy back the short)
+            self.cash += sign * current_price * quantity
+            pnl = sign * (current_price - self.entry[idx]) * quantity
 
             self.realized_pnl += pnl
 
@@ -227,31 +353,25 @@ class PortfolioManager:
                 current_price, quantity, round(pnl, 2)
             )
 
-            del self.positions[symbol]
+        self.open_mask &= ~exit_mask
 
-    def update_valuation(self, timestamp, market_data):
+    def update_valuation(self, timestamp, price_vec):
         """
         Calculates the total portfolio value (cash plus market value of open positions)
         and the total unrealized PNL.
+        Positions without a price in this bar are left out, as before.
         """
-        total_value = self.cash + self.realized_pnl
-        unrealized = 0.0
-        prices = {d['symbol']: float(d['close']) for d in market_data}
-        for sym, info in self.positions.items():
-            if sym in prices:
-                current_price = prices[sym]
-                if info['position_type'] == 'BUY':
-                    total_value += (current_price * info['quantity'])
-                else:  # short
-                    total_value -= (current_price * info['quantity'])
-                entry = info['entry_price']
-                if info['position_type'] == 'BUY':
-                    unrealized += (current_price - entry) * info['quantity']
-                else:
-                    unrealized += (entry - current_price) * info['quantity']
-        return total_value, unrealized
+        held = self.open_mask & ~np.isnan(price_vec)
+
+        market_value = (self.sign * self.qty * price_vec)[held].sum()
+        unrealized = (self.sign * (price_vec - self.entry) * self.qty)[held].sum()
+        return self.cash + self.realized_pnl + float(market_value), float(unrealized)
 
 
+# CSV logs are written through a 1 MiB buffer and flushed every FLUSH_EVERY rows
+WRITE_BUFFER_SIZE = 1 << 20
+FLUSH_EVERY = 1000
+
 # Server configuration
 HOST = "127.0.0.1"  # or wherever your TCP server is running
 PORT = 9999
@@ -260,55 +380,59 @@ def start_client():
     strategy = TradingStrategy(risk_amount=1.0)
     portfolio = PortfolioManager(risk_amount=1.0)
     
-    # Open CSV file to track portfolio session report (existing file)
+    # Open CSV file to track portfolio session report (existing file), held open for the whole session
     session_report_file = 'data/trading_session_report.csv'
     os.makedirs(os.path.dirname(session_report_file), exist_ok=True)
-    with open(session_report_file, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Timestamp', 'Total Value', 'Unrealized_PnL', 'Positions_Held'])
-    
-    # Connect to the market data server
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
-        print(f"Connected to server at {HOST}:{PORT}")
-        
-        while True:
-            try:
-                data = s.recv(65535)
-                if not data:
-                    break  # No more data from server
-                message = json.loads(data.decode())
-                print("Raw market data received:", message)
-                timestamp = message['timestamp']
-                securities = message['data']
-                print(f"\nReceived market data for {timestamp}")
-                
-                # Update buffers and generate signals for each security
-                for sec in securities:
-                    symbol = sec['symbol']
-                    strategy.update_buffer(symbol, sec)
-                    trade_signal = strategy.generate_trade_signal(symbol)
-                    
-                    # If a signal is generated and no position is open, open a new position
-                    if trade_signal and symbol not in portfolio.positions:
-                        price = float(sec['close'])
-                        portfolio.open_position(symbol, trade_signal, price, timestamp, is_stock=strategy.is_stock(symbol))
-                     
-                    # Always check if open positions need to be exited
-                    portfolio.update_positions(symbol, float(sec['close']), timestamp)
-                
-                # Update portfolio valuation and log the session report
-                total_value, unrealized = portfolio.update_valuation(timestamp, securities)
-                print(f"Portfolio Summary: Cash: ${portfolio.cash:,.2f}, Total Value: ${total_value:,.2f}, Unrealized PnL: ${unrealized:+,.2f}, Positions: {len(portfolio.positions)}")
-                
-                with open(session_report_file, 'a', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([timestamp, round(total_value, 2), round(unrealized, 2), len(portfolio.positions)])
-            except json.JSONDecodeError:
-                print("Invalid JSON received, skipping...")
-                continue
-        
+    with open(session_report_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as report_fh:
+        report_writer = csv.writer(report_fh)
+        report_writer.writerow(['Timestamp', 'Total Value', 'Unrealized_PnL', 'Positions_Held'])
+        report_rows = 0
+
+        # Connect to the market data server
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                set_nodelay(s)
+                set_receive_buffer(s)
+                s.connect((HOST, PORT))
+                print(f"Connected to server at {HOST}:{PORT}")
+
+                for line in read_lines(s):
+                    try:
+                        message = loads(line)
+                        log.debug("Raw market data received: %s", message)
+                        timestamp = message['timestamp']
+                        securities = message['data']
+                        print(f"\nReceived market data for {timestamp}")
+
+                        # Update buffers and generate signals for each security
+                        for sec in securities:
+                            symbol = sec['symbol']
+                            strategy.update_buffer(symbol, sec)
+                            trade_signal = strategy.generate_trade_signal(symbol)
+
+                            # If a signal is generated and no position is open, open a new position
+                            if trade_signal and not portfolio.has_position(symbol):
+                                price = float(sec['close'])
+                                portfolio.open_position(symbol, trade_signal, price, timestamp, is_stock=strategy.is_stock(symbol))
+
+                        # Check every open position for an exit, then value the portfolio at this bar's prices
+                        price_vec = portfolio.price_vector(securities)
+                        portfolio.update_positions(timestamp, price_vec)
+                        total_value, unrealized = portfolio.update_valuation(timestamp, price_vec)
+                        print(f"Portfolio Summary: Cash: ${portfolio.cash:,.2f}, Total Value: ${total_value:,.2f}, Unrealized PnL: ${unrealized:+,.2f}, Positions: {portfolio.open_count}")
+
+                        report_writer.writerow([timestamp, round(total_value, 2), round(unrealized, 2), portfolio.open_count])
+                        report_rows += 1
+                        if report_rows % FLUSH_EVERY == 0:
+                            report_fh.flush()
+                    except JSONDecodeError:
+                        print("Invalid JSON received, skipping...")
+                        continue
+        finally:
+            portfolio.close()
+
     print("Trading session ended")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     start_client()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+
+# Strategy constants; Numba freezes module-level scalars into the compiled kernel as literals
+BB_WINDOW = 20          # Window of the Bollinger Bands / volume statistics
+BB_DEV = 2.0            # Band width and volume spike threshold, in standard deviations
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+MACD_THRESHOLD = 0.1
+
+# Not disk-cached: this module is also imported as src.local_trading.indicator_core (by the live strategy), and
+# Numba's cache for one file can't serve both module names. The cached kernels calling it compile it in.
+@njit(nogil=True)
+def pairwise_sum(x):
+    """Sum in the same order as NumPy's pairwise summation (for up to 128 values), so results match it bit for bit."""
+    n = len(x)
+    if n < 8:
+        total = 0.0
+        for i in range(n):
+            total += x[i]
+        return total
+    r = x[:8].copy()
+    i = 8
+    while i <= n - 8:
+        for j in range(8):
+            r[j] += x[i + j]
+        i += 8
+    total = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]))
+    while i < n:
+        total += x[i]
+        i += 1
+    return total
+
+@njit(cache=True)
+def _mean_std(x, ddof):
+    mean = pairwise_sum(x) / len(x)
+    return mean, np.sqrt(pairwise_sum((x - mean) ** 2) / (len(x) - ddof))
+
+@njit(cache=True, parallel=True)
+def update_and_signal(rows, open_price, close_price, volume, close_ring, volume_ring, head, count,
+                      macd_weights, update, out):
+    """
+    Runs the three-strategy vote for one tick of bars as compiled code.
+
+    State is the structure of arrays held by `IncrementalIndicators`: each row's closes and volumes are
+    written twice into (symbols x 2*buffer_size) rings, so the last N bars of a row are the slice ending at
+    `head + buffer_size`.
+
+    :param rows: Row of each bar's symbol (each row at most once).
+    :param open_price / close_price / volume: Bar values aligned with `rows`.
+    :param macd_weights: (buffer_size+1 x buffer_size) matrix; row L holds the MACD line-minus-signal
+                         weights of a window of L closes in its first L columns.
+    :param update: Append the bars to the state first (False evaluates the latest buffered bars).
+    :param out: Filled with 1 (BUY), -1 (SELL) or 0 for each bar.
+    """
+    size = close_ring.shape[1] // 2
+
+    # Every bar touches only its own row of the state, so bars are processed in parallel
+    for k in prange(len(rows)):
+        r = rows[k]
+        close = close_price[k]
+
+        if update:
+            h = head[r]
+            close_ring[r, h] = close_ring[r, h + size] = close
+            volume_ring[r, h] = volume_ring[r, h + size] = volume[k]
+            head[r] = (h + 1) % size
+            count[r] = min(count[r] + 1, size)
+
+        out[k] = 0
+        n = count[r]
+        if n < BB_WINDOW:
+            continue  # Need at least 20 data points
+        end = head[r] + size
+
+        # --- Bollinger Bands Strategy ---
+        bb_middle, bb_std = _mean_std(close_ring[r, end - BB_WINDOW:end], 0)
+        bb_upper = bb_middle + BB_DEV * bb_std
+        bb_lower = bb_middle - BB_DEV * bb_std
+        previous_close = close_ring[r, end - 2]
+
+        # --- MACD Crossover with Threshold ---
+        macd_diff = 0.0
+        for j in range(n):
+            macd_diff += macd_weights[n, j] * close_ring[r, end - n + j]
+
+        # --- Volume Spike Confirmation ---
+        volume_ma, volume_std = _mean_std(volume_ring[r, end - BB_WINDOW:end], 1)
+        spike = volume[k] > volume_ma + BB_DEV * volume_std
+        bullish = close > open_price[k]
+
+        # --- Voting System: each strategy adds one vote; 2 or more 'BUY' → BUY, 2 or more 'SELL' → SELL ---
+        buy = (int(close < bb_lower and previous_close >= bb_lower)
+               + int(macd_diff > MACD_THRESHOLD)
+               + int(spike and bullish))
+        sell = (int(close > bb_upper and previous_close <= bb_upper)
+                + int(macd_diff < -MACD_THRESHOLD)
+                + int(spike and not bullish))
+        out[k] = 1 if buy >= 2 else (-1 if sell >= 2 else 0)
+
+
+@njit(cache=True)
+def indicator_bundle(close_ring, volume_ring, head, count, macd_line_weights, macd_signal_weights, r):
+    """
+    Bollinger Bands, MACD, and volume statistics of row `r`'s latest bar in one compiled pass over
+    its rings (laid out as in `update_and_signal`). The row must hold at least BB_WINDOW bars.
+
+    :param macd_line_weights / macd_signal_weights: (buffer_size+1 x buffer_size) matrices from `macd_weight_matrix`.
+    :return: (bb_upper, bb_lower, bb_middle, macd_line, macd_signal, volume_ma, volume_std)
+    """
+    size = close_ring.shape[1] // 2
+    n = count[r]
+    end = head[r] + size
+
+    # Bollinger Bands (20-period, 2 std dev)
+    bb_middle, bb_std = _mean_std(close_ring[r, end - BB_WINDOW:end], 0)
+
+    # MACD line and signal, both linear in the buffered closes
+    macd_line = 0.0
+    macd_signal = 0.0
+    for j in range(n):
+        close = close_ring[r, end - n + j]
+        macd_line += macd_line_weights[n, j] * close
+        macd_signal += macd_signal_weights[n, j] * close
+
+    # 20-bar volume moving average & standard deviation
+    volume_ma, volume_std = _mean_std(volume_ring[r, end - BB_WINDOW:end], 1)
+
+    return (bb_middle + BB_DEV * bb_std, bb_middle - BB_DEV * bb_std, bb_middle,
+            macd_line, macd_signal, volume_ma, volume_std)
+
+@njit(cache=True)
+def indicator_batch(close_ring, volume_ring, head, count, macd_line_weights, macd_signal_weights, rows, out):
+    """
+    `indicator_bundle` for each of `rows` in one compiled call.
+
+    :param out: (len(rows) x 7) array, filled with each row's bundle in `indicator_bundle`'s order
+                (all NaN for rows with fewer than BB_WINDOW bars).
+    """
+    for k in range(len(rows)):
+        r = rows[k]
+        if count[r] < BB_WINDOW:
+            out[k, :] = np.nan
+            continue
+        (out[k, 0], out[k, 1], out[k, 2], out[k, 3], out[k, 4], out[k, 5], out[k, 6]) = indicator_bundle(
+            close_ring, volume_ring, head, count, macd_line_weights, macd_signal_weights, r)
+
+class IncrementalIndicators:
+    """
+    Rolling indicator state for every symbol, stored as a structure of arrays with one row per symbol.
+
+    Closes and volumes are kept in preallocated (symbols x 2*buffer_size) arrays where every value is
+    written twice (at `i` and `i + size`), so the last N bars of a row never wrap around. The arrays are
+    updated by `append` or by the compiled `update_and_signal`.
+    """
+    # Fixed attribute slots: no per-instance __dict__ lookups on the per-tick path
+    __slots__ = ('size', 'rows', 'close', 'volume', 'head', 'count')
+
+    def __init__(self, buffer_size, capacity=64, dtype=np.float64):
+        self.size = buffer_size
+        self.rows = {}  # symbol -> row
+        self.close = np.empty((capacity, 2 * buffer_size), dtype=dtype)
+        self.volume = np.empty((capacity, 2 * buffer_size), dtype=dtype)
+        self.head = np.zeros(capacity, dtype=np.int64)  # Next write position of each row
+        self.count = np.zeros(capacity, dtype=np.int64)
+
+    def row_ids(self, symbols):
+        """Rows of `symbols`, assigning (and growing the arrays for) symbols seen for the first time."""
+        for symbol in symbols:
+            if symbol not in self.rows:
+                if len(self.rows) == len(self.head):
+                    self._grow()
+                self.rows[symbol] = len(self.rows)
+        return np.fromiter((self.rows[symbol] for symbol in symbols), dtype=np.int64, count=len(symbols))
+
+    def _grow(self):
+        for name in ('close', 'volume', 'head', 'count'):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros_like(arr))))
+
+    def append(self, rows, close, volume):
+        """Writes one bar per row (each row at most once) into the rings; O(1) per bar."""
+        h = self.head[rows]
+        self.close[rows, h] = self.close[rows, h + self.size] = close
+        self.volume[rows, h] = self.volume[rows, h + self.size] = volume
+        self.head[rows] = (h + 1) % self.size
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.size)
+
+    def last_close(self, rows, age=0):
+        """Close from `age` bars ago (0 = latest) for each of `rows`."""
+        return self.close[rows, self.head[rows] + self.size - 1 - age]
+
+    def window(self, field, rows, n):
+        """(rows x n) array of the last `n` values of `field` ('close' or 'volume'), oldest first."""
+        end = self.head[rows] + self.size
+        return getattr(self, field)[rows[:, None], end[:, None] - n + np.arange(n)]
+
+    def indicators(self, symbol, macd_line_weights, macd_signal_weights):
+        """
+        Bollinger Bands, MACD, and volume statistics of the symbol's latest bar, or None before 20 bars.
+        Bollinger Bands and volume use the last 20 bars; MACD uses the whole buffered window.
+
+        :param macd_line_weights / macd_signal_weights: Matrices from `macd_weight_matrix`.
+        """
+        row = self.row_ids([symbol])[0]
+        if self.count[row] < BB_WINDOW:
+            return None  # Need at least 20 data points
+
+        bb_upper, bb_lower, bb_middle, macd_line, macd_signal, volume_ma, volume_std = indicator_bundle(
+            self.close, self.volume, self.head, self.count, macd_line_weights, macd_signal_weights, row)
+        return {
+            'bb_upper': bb_upper,
+            'bb_lower': bb_lower,
+            'bb_middle': bb_middle,
+            'macd_line': macd_line,
+            'macd_signal': macd_signal,
+            'macd_diff': macd_line - macd_signal,
+            'volume_ma': volume_ma,
+            'volume_std': volume_std
+        }
+
+    def indicators_batch(self, rows, macd_line_weights, macd_signal_weights):
+        """
+        `indicators` of the latest bar of every row at once, as a (len(rows) x 7) array with columns
+        (bb_upper, bb_lower, bb_middle, macd_line, macd_signal, volume_ma, volume_std); NaN before 20 bars.
+        """
+        out = np.empty((len(rows), 7))
+        indicator_batch(self.close, self.volume, self.head, self.count,
+                        macd_line_weights, macd_signal_weights, rows, out)
+        return out
+
+
+def macd_window_weights(buffer_size):
+    """
+    Weights w[L] such that `w[L] @ window` gives the last (MACD line, MACD signal, line minus signal)
+    values of a window of L closes (NaN where the window is too short for the series).
+    Obtained by running the MACD EMAs on the identity matrix, since each bar's response is a unit impulse.
+    """
+    weights = {}
+    for length in range(BB_WINDOW, buffer_size + 1):
+        impulses = pd.DataFrame(np.eye(length))
+        ema_fast = impulses.ewm(span=MACD_FAST, min_periods=MACD_FAST, adjust=False).mean()
+        ema_slow = impulses.ewm(span=MACD_SLOW, min_periods=MACD_SLOW, adjust=False).mean()
+        macd_line = ema_fast - ema_slow
+        macd_signal = macd_line.ewm(span=MACD_SIGNAL, min_periods=MACD_SIGNAL, adjust=False).mean()
+        weights[length] = np.stack((macd_line.iloc[-1], macd_signal.iloc[-1], (macd_line - macd_signal).iloc[-1]))
+    return weights
+
+
+def macd_weight_matrix(weights, buffer_size, component):
+    """
+    One component of `macd_window_weights` (0 = line, 1 = signal, 2 = line minus signal) as a
+    (buffer_size+1 x buffer_size) matrix for the compiled kernels: row L holds a window of L closes.
+    """
+    matrix = np.full((buffer_size + 1, buffer_size), np.nan)
+    for length, w in weights.items():
+        matrix[length, :length] = w[component]
+    return matrix
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import socket
+
+# orjson encodes/decodes the tick payloads several times faster; fall back to the standard library if it isn't installed
+try:
+    import orjson
+    loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def encode_line(obj):
+        """Serialize `obj` as one newline-framed UTF-8 JSON message."""
+        return orjson.dumps(obj) + b'\n'
+except ImportError:
+    import json
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+    def encode_line(obj):
+        """Serialize `obj` as one newline-framed UTF-8 JSON message."""
+        return (json.dumps(obj) + '\n').encode('utf-8')
+
+def read_lines(sock, bufsize=131072):
+    """
+    Yields each complete newline-framed message received on `sock` (as bytes, without the newline),
+    matching tcp_server's one-JSON-object-per-line framing. A single recv() may hold several messages
+    or only part of one; partial messages are kept until the rest arrives.
+    Data is received into one preallocated buffer, so no new bytes object is created per packet.
+    The consumed messages are dropped from the pending bytes once per recv() rather than once per
+    message, so a packet holding many messages is not shifted over and over.
+    Returns when the server closes the connection.
+    """
+    chunk = bytearray(bufsize)
+    view = memoryview(chunk)
+    buf = bytearray()
+    while (n := sock.recv_into(view)) > 0:
+        buf += view[:n]
+        start = 0
+        while (nl := buf.find(b'\n', start)) != -1:
+            line = bytes(buf[start:nl])
+            start = nl + 1
+            if line.strip():
+                yield line
+        del buf[:start]
+
+def set_nodelay(sock):
+    """Disables Nagle's algorithm so each small tick message is sent / acknowledged without delay."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+# Requested kernel receive buffer (12 MiB); Linux caps it at net.core.rmem_max
+RECV_BUFFER_SIZE = 12 << 20
+
+def set_receive_buffer(sock, size=RECV_BUFFER_SIZE):
+    """
+    Enlarges the socket's kernel receive buffer so bursts of ticks queue in the kernel instead of
+    stalling the sender. Call before connect(): the TCP window scale is negotiated in the handshake.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+
+# Bar fields sent as numbers; the server streams every CSV field as a string
+NUMERIC_FIELDS = frozenset(('open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap'))
+
+def parse_bar(data_point):
+    """Returns a copy of one streamed bar with its numeric fields converted to float (empty fields are left as-is)."""
+    return {k: (float(v) if k in NUMERIC_FIELDS and v != '' else v) for k, v in data_point.items()}
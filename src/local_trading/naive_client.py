@@ -1,8 +1,9 @@
 import socket
-import json
 import csv
 import datetime
 
+from message_stream import read_lines, loads, JSONDecodeError, set_nodelay, set_receive_buffer
+
 # Server configuration
 HOST = "127.0.0.1"  
 PORT = 9999         
@@ -12,68 +13,66 @@ starting_cash = 100000  # Start with $100K
 cash_balance = starting_cash
 portfolio = {}  # Example: { "AAPL": {"quantity": 10, "avg_price": 150.00, "last_close": 150.00} }
 log_file = "data/trading_session_report.csv"
+FLUSH_EVERY = 100  # Flush the session report every N snapshots
 
 def start_client():
     """ Connects to the server and receives the finance price stream. """
     global cash_balance, portfolio
+    log_handle = None  # Session report file, held open (1 MiB buffer) while the client runs
 
     # Create a TCP socket
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    set_nodelay(client)
+    set_receive_buffer(client)
     
     try:
         # Connect to the finance server
         client.connect((HOST, PORT))
         print(f"✅ Connected to server at {HOST}:{PORT}")
 
-        buffer = ""
+        # Initialize CSV file with headers and keep it open for the rest of the session
+        log_handle = open(log_file, mode="w", newline="", buffering=1 << 20)
+        log_writer = csv.writer(log_handle)
+        log_writer.writerow(["Timestamp", "Cash Balance", "Total Equity", "Unrealized PnL"])
 
-        # Initialize CSV file with headers
-        with open(log_file, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Cash Balance", "Total Equity", "Unrealized PnL"])
+        snapshots = 0
 
-        # Continuously receive data from the server
-        while True:
-            chunk = client.recv(4096).decode("utf-8")  # Large buffer to handle JSON list
-            if not chunk:
-                print("⚠️ Server closed connection.")
-                break  # Exit if the server closes connection
+        # Continuously receive newline-framed JSON messages from the server
+        for line in read_lines(client):
+            try:
+                message = loads(line)  # Parse JSON safely
 
-            buffer += chunk
+                if not isinstance(message, dict) or "timestamp" not in message or "data" not in message:
+                    print(f"⚠️ Invalid message format: {message}")
+                    continue  # Skip invalid messages
 
-            # Process complete JSON objects
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)  # Extract one JSON object
-                
-                try:
-                    message = json.loads(line.strip())  # Parse JSON safely
-                    
-                    if not isinstance(message, dict) or "timestamp" not in message or "data" not in message:
-                        print(f"⚠️ Invalid message format: {message}")
-                        continue  # Skip invalid messages
+                timestamp = message["timestamp"]
+                securities_data = message["data"]
 
-                    timestamp = message["timestamp"]
-                    securities_data = message["data"]
+                print(f"\n📊 Market Data for {timestamp}:")
+                for security in securities_data:
+                    print(f"  {security['symbol']}: Open={security['open']}, Close={security['close']}")
 
-                    print(f"\n📊 Market Data for {timestamp}:")
-                    for security in securities_data:
-                        print(f"  {security['symbol']}: Open={security['open']}, Close={security['close']}")
+                # Process the received securities data
+                trading_signals = process_market_data(securities_data)
 
-                    # Process the received securities data
-                    trading_signals = process_market_data(securities_data)
+                # Print generated trading signals
+                for signal in trading_signals:
+                    print(f"🚀 TRADE SIGNAL: {signal}")
 
-                    # Print generated trading signals
-                    for signal in trading_signals:
-                        print(f"🚀 TRADE SIGNAL: {signal}")
+                # Calculate updated PnL and show portfolio status
+                display_portfolio(securities_data)
 
-                    # Calculate updated PnL and show portfolio status
-                    display_portfolio(securities_data)
+                # Save snapshot to CSV after each valid market update
+                save_portfolio_snapshot(log_writer, timestamp)
+                snapshots += 1
+                if snapshots % FLUSH_EVERY == 0:
+                    log_handle.flush()
 
-                    # Save snapshot to CSV after each valid market update
-                    save_portfolio_snapshot(timestamp)
+            except JSONDecodeError as e:
+                print(f"⚠️ Error parsing JSON: {line.decode(errors='replace')} ({e})")
 
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ Error parsing JSON: {line} ({e})")
+        print("⚠️ Server closed connection.")
 
     except ConnectionRefusedError:
         print("⚠️ Error: Could not connect to server. Make sure it is running.")
@@ -81,7 +80,9 @@ def start_client():
         print(f"⚠️ Unexpected error: {e}")
     finally:
         client.close()
-        save_portfolio_snapshot("Final Snapshot")  # Save final state
+        if log_handle is not None:
+            save_portfolio_snapshot(log_writer, "Final Snapshot")  # Save final state
+            log_handle.close()
         print("✅ Trading session ended. Report saved.")
 
 def process_market_data(securities_data):
@@ -163,8 +164,8 @@ def display_portfolio(securities_data):
     print(f"🏦 Total Equity Value: ${equity_value:,.2f}")
     print("-" * 50)
 
-def save_portfolio_snapshot(timestamp):
-    """Saves current PnL and portfolio status to a CSV file with all numbers rounded to 2 decimals."""
+def save_portfolio_snapshot(writer, timestamp):
+    """Saves current PnL and portfolio status to the session report `writer` with all numbers rounded to 2 decimals."""
     global cash_balance, portfolio
 
     total_equity = cash_balance
@@ -180,10 +181,8 @@ def save_portfolio_snapshot(timestamp):
     total_equity_rounded = round(total_equity, 2)
     unrealized_pnl_rounded = round(unrealized_pnl, 2)
 
-    # Append to CSV
-    with open(log_file, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, cash_rounded, total_equity_rounded, unrealized_pnl_rounded])
+    # Append to the open session report
+    writer.writerow([timestamp, cash_rounded, total_equity_rounded, unrealized_pnl_rounded])
 
     print(f"💾 Logged Portfolio Snapshot: Cash=${cash_rounded}, Total Equity=${total_equity_rounded}, PnL=${unrealized_pnl_rounded}")
 
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from numba import njit
+
+# Signal / trade action codes shared with the backtest
+HOLD, BUY, SELL = 0, 1, -1
+
+@njit(cache=True)
+def step(symbol_ids, prices, signals, n_symbols, cash):
+    """
+    Runs the three-strategy PortfolioManager over a whole bar sequence as compiled code.
+
+    Positions are parallel arrays indexed by symbol id instead of a dict of dicts. Trade sizing and
+    valuation follow `PortfolioManager.execute_trade` / `update_valuation` exactly:
+      - BUY up to 10% of cash or $1000 (whichever is smaller), averaging into existing positions.
+      - SELL the same notional, capped at the shares held.
+      - Each row is valued with cash plus the position of that row's symbol.
+
+    :param symbol_ids: int array, symbol id of each bar.
+    :param prices: float array, close price of each bar.
+    :param signals: int array of BUY / SELL / HOLD codes for each bar.
+    :param n_symbols: Number of distinct symbol ids.
+    :param cash: Starting cash.
+    :return: Per-bar (cash, total_value, unrealized, positions_held) arrays, and the trade log as
+             (row, symbol_id, action, price, quantity) arrays.
+    """
+    n = len(prices)
+    qty = np.zeros(n_symbols, dtype=np.int64)
+    avg_price = np.zeros(n_symbols)
+    open_positions = 0
+
+    cash_out = np.empty(n)
+    total_value = np.empty(n)
+    unrealized = np.empty(n)
+    positions_held = np.empty(n, dtype=np.int64)
+
+    # Preallocated trade log; at most one trade per bar
+    trade_row = np.empty(n, dtype=np.int64)
+    trade_symbol = np.empty(n, dtype=np.int64)
+    trade_action = np.empty(n, dtype=np.int64)
+    trade_price = np.empty(n)
+    trade_qty = np.empty(n, dtype=np.int64)
+    n_trades = 0
+
+    for i in range(n):
+        sym = symbol_ids[i]
+        price = prices[i]
+        signal = signals[i]
+
+        if signal != HOLD:
+            max_investment = min(cash * 0.1, 1000.0)
+            quantity = int(max_investment / price)
+
+            if quantity >= 1:
+                traded = 0
+                if signal == BUY and cash >= price * quantity:
+                    cost = price * quantity
+                    cash -= cost
+                    if qty[sym] > 0:
+                        total_cost = (avg_price[sym] * qty[sym]) + cost
+                        qty[sym] += quantity
+                        avg_price[sym] = total_cost / qty[sym]
+                    else:
+                        qty[sym] = quantity
+                        avg_price[sym] = price
+                        open_positions += 1
+                    traded = quantity
+                elif signal == SELL and qty[sym] > 0:
+                    traded = min(quantity, qty[sym])
+                    cash += price * traded
+                    qty[sym] -= traded
+                    if qty[sym] <= 0:
+                        open_positions -= 1
+
+                if traded > 0:
+                    trade_row[n_trades] = i
+                    trade_symbol[n_trades] = sym
+                    trade_action[n_trades] = signal
+                    trade_price[n_trades] = price
+                    trade_qty[n_trades] = traded
+                    n_trades += 1
+
+        # Valuation uses this bar's price for its own symbol only
+        cash_out[i] = cash
+        total_value[i] = cash
+        unrealized[i] = 0.0
+        if qty[sym] > 0:
+            total_value[i] += price * qty[sym]
+            unrealized[i] += (price - avg_price[sym]) * qty[sym]
+        positions_held[i] = open_positions
+
+    return (cash_out, total_value, unrealized, positions_held,
+            trade_row[:n_trades], trade_symbol[:n_trades], trade_action[:n_trades],
+            trade_price[:n_trades], trade_qty[:n_trades])
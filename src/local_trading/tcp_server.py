@@ -1,78 +1,65 @@
 #!/usr/bin/env python3
 
-import socket
-import threading
-import csv
-import json
+import asyncio
+import pandas as pd
 import argparse
 import sys
-import time
 import datetime
+from message_stream import encode_line, set_nodelay
 
-class ThreadedServer(object):
+class StreamServer(object):
     def __init__(self, host, opt):
         self.host = host
         self.port = opt.port
         self.opt = opt
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((self.host, self.port))
-        self.lock = threading.Lock()
+        # Market data is loaded, grouped and encoded once, then shared by every client connection
+        self.encoded = [(timestamp, encode_line({"timestamp": timestamp, "data": data})) for timestamp, data in self.sendCSVfile()]
 
     def listen(self):
-        """ Listens for incoming client connections """
-        self.sock.listen(5)
+        """ Listens for incoming client connections; every client is served from a single event loop """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.sendStreamToClient, self.host, self.port, reuse_address=True)
         print(f"Server listening on {self.host}:{self.port}...")
-        
-        while True:
-            client, address = self.sock.accept()
-            client.settimeout(500)
-            print(f"New client connected: {address}")
-            
-            # Start a thread to send market data to the client
-            threading.Thread(target=self.sendStreamToClient, args=(client, self.sendCSVfile())).start()
+        async with server:
+            await server.serve_forever()
+
+    async def sendStreamToClient(self, reader, writer):
+        """ Sends pre-encoded market data messages (all stocks for a given timestamp) to the client """
+        print(f"New client connected: {writer.get_extra_info('peername')}")
+        set_nodelay(writer.get_extra_info('socket'))
 
-    def sendStreamToClient(self, client, buffer):
-        """ Sends grouped market data (all stocks for a given timestamp) to the client """
-        for timestamp, data in buffer.items():
+        for timestamp, message in self.encoded:
             print(f"Sending data for {timestamp}")
 
             try:
-                message = json.dumps({"timestamp": timestamp, "data": data}) + '\n'
-                client.sendall(message.encode('utf-8'))
-                
-                # Sleep to simulate real-time streaming
-                time.sleep(self.opt.interval)
-            
+                writer.write(message)
+                await writer.drain()
+
+                # Sleep to simulate real-time streaming, without blocking the other clients
+                await asyncio.sleep(self.opt.interval)
+
             except Exception as e:
                 print(f"Client disconnected. Error: {e}")
-                client.close()
+                writer.close()
                 return False
-        
+
         print("End of data stream")
-        client.close()
+        writer.close()
         return False
 
     def sendCSVfile(self):
-        """ Reads CSV files, groups data by timestamp, and returns a sorted dictionary """
-        data_by_timestamp = {}
-
+        """ Reads CSV files, groups data by timestamp, and returns a list of (timestamp, rows) sorted by timestamp """
+        frames = []
         for f in self.opt.files:
             print(f'Reading file {f}...')
-            with open(f, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                next(reader)  # Skip the header
-                
-                for row in reader:
-                    timestamp = row["timestamp"]
-                    
-                    # Group all stocks under the same timestamp
-                    if timestamp not in data_by_timestamp:
-                        data_by_timestamp[timestamp] = []
-                    
-                    data_by_timestamp[timestamp].append(row)
+            # Keep every field as the raw CSV string, as the clients expect
+            frames.append(pd.read_csv(f, dtype=str, keep_default_na=False, engine='c', low_memory=False))
+        df = pd.concat(frames, ignore_index=True)
 
-        return data_by_timestamp
+        # Group all stocks under the same timestamp
+        return [(timestamp, rows.to_dict(orient='records')) for timestamp, rows in df.groupby('timestamp', sort=True)]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(usage='usage: tcp_server -p port [-f -m]')
@@ -81,4 +68,4 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--time-interval", action="store", dest="interval", type=float, default=1.0, help="Time interval between updates (seconds)")
     
     opt = parser.parse_args()
-    ThreadedServer('127.0.0.1', opt).listen()
\ No newline at end of file
+    StreamServer('127.0.0.1', opt).listen()
\ No newline at end of file
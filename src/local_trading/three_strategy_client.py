@@ -1,69 +1,64 @@
 #!/usr/bin/env python3
 # scripts/three_strategy_client.py
 
-import socket
-import json
-import csv
-from collections import defaultdict, deque
+import asyncio
+import logging
+from operator import itemgetter
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-from ta.momentum import RSIIndicator
-from ta.trend import MACD
-from ta.volatility import BollingerBands
+from message_stream import loads, JSONDecodeError, set_nodelay
+from indicator_core import IncrementalIndicators, macd_window_weights, macd_weight_matrix, update_and_signal
+
+# Per-tick messages are logged at DEBUG and the portfolio summary every SUMMARY_EVERY ticks at INFO
+log = logging.getLogger(__name__)
 
 # Server configuration
 HOST = "127.0.0.1"  # or wherever your tcp_server is listening
 PORT = 9999
 
+# Session report is written through a 1 MiB buffer and flushed every FLUSH_EVERY rows
+WRITE_BUFFER_SIZE = 1 << 20
+FLUSH_EVERY = 1000
+SUMMARY_EVERY = 10
+
+# Longest message line the stream reader accepts (one tick of bars for every symbol)
+READ_LIMIT = 1 << 22
+
+# Kernel vote codes -> generate_signal results
+SIGNAL_NAMES = {1: 'BUY', -1: 'SELL', 0: None}
+
 class TradingStrategy:
     """
     A triple-factor day trading strategy using Bollinger Bands, MACD, and Volume Spike.
     Uses a voting system for trade signals.
     """
+    __slots__ = ('buffer_size', 'state', 'macd_weights', '_macd_line_weights', '_macd_signal_weights', '_macd_diff_weights')
     
-    def __init__(self):
-        # Store up to 100 recent data points per symbol
-        self.data_buffers = defaultdict(lambda: deque(maxlen=100))
+    def __init__(self, buffer_size=100):
+        # Indicators see up to `buffer_size` recent data points per symbol
+        self.buffer_size = buffer_size
+        # float32 halves the bytes the kernel reads per bar; the votes' thresholds are far coarser than its precision
+        self.state = IncrementalIndicators(self.buffer_size, dtype=np.float32)
+        # MACD weights for each window length, shared with generate_signals_vectorized
+        self.macd_weights = macd_window_weights(self.buffer_size)
+        # The same weights as matrices for the compiled kernels
+        self._macd_line_weights = macd_weight_matrix(self.macd_weights, self.buffer_size, 0)
+        self._macd_signal_weights = macd_weight_matrix(self.macd_weights, self.buffer_size, 1)
+        self._macd_diff_weights = macd_weight_matrix(self.macd_weights, self.buffer_size, 2)
 
     def update_buffers(self, symbol, data_point):
-        """Append the latest data point to the symbol's buffer."""
-        self.data_buffers[symbol].append(data_point)
+        """Append the latest data point to the symbol's indicator state."""
+        self._run([symbol], *_bar_arrays([data_point]), update=True)
 
     def calculate_indicators(self, symbol):
-        """Calculate Bollinger Bands, MACD, RSI, and volume statistics."""
-        buffer = list(self.data_buffers[symbol])
-        if len(buffer) < 20:  
-            return None  # Need at least 20 data points
-        
-        df = pd.DataFrame(buffer)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-        
-        # Bollinger Bands (20-period, 2 std dev)
-        bb = BollingerBands(df['close'], window=20, window_dev=2)
-        
-        # MACD (12,26,9)
-        macd = MACD(df['close'], window_slow=26, window_fast=12, window_sign=9)
-        
-        # RSI (14-period)
-        rsi = RSIIndicator(df['close'], window=14)
-        
-        # 20-bar volume moving average & standard deviation
-        volume_ma = df['volume'].rolling(20).mean().iloc[-1]
-        volume_std = df['volume'].rolling(20).std().iloc[-1]
-
-        return {
-            'bb_upper': bb.bollinger_hband().iloc[-1],
-            'bb_lower': bb.bollinger_lband().iloc[-1],
-            'bb_middle': bb.bollinger_mavg().iloc[-1],
-            'macd_line': macd.macd().iloc[-1],
-            'macd_signal': macd.macd_signal().iloc[-1],
-            'rsi': rsi.rsi().iloc[-1],
-            'volume_ma': volume_ma,
-            'volume_std': volume_std
-        }
+        """
+        Calculate Bollinger Bands, MACD, and volume statistics from the symbol's rolling state.
+        Bollinger Bands and volume use the last 20 bars; MACD uses the whole buffered window.
+        """
+        return self.state.indicators(symbol, self._macd_line_weights, self._macd_signal_weights)
 
     def generate_signal(self, symbol, current_data):
         """
@@ -72,61 +67,125 @@ class TradingStrategy:
         2. MACD crossover with threshold
         3. Volume spike above statistical significance
         """
-        indicators = self.calculate_indicators(symbol)
-        if not indicators:
-            return None  # Not enough data
+        return self._run([symbol], *_bar_arrays([current_data]), update=False)[0]
 
-        signals = []
-        close_price = float(current_data['close'])
-        volume = float(current_data['volume'])
-        open_price = float(current_data['open'])
+    def generate_tick_signals(self, symbols, open_price, close_price, volume):
+        """
+        Appends every bar of one tick to the indicator state and returns the `generate_signal`
+        result for each, computing the indicators for all symbols in a single compiled pass.
 
-        # Ensure previous_close is properly extracted and converted to float
-        try:
-            previous_close = float(list(self.data_buffers[symbol])[-2]['close']) if len(self.data_buffers[symbol]) > 1 else close_price
-        except (KeyError, ValueError, TypeError):
-            previous_close = close_price  # Fallback to current close if there's an issue
+        :param symbols: Symbols of one timestamp's bars, each at most once.
+        :param open_price / close_price / volume: Float arrays of the bar values, aligned with `symbols`.
+        :return: List of 'BUY', 'SELL' or None aligned with `symbols`.
+        """
+        return self._run(symbols, open_price, close_price, volume, update=True)
+
+    def _run(self, symbols, open_price, close_price, volume, update):
+        """Runs the compiled update / vote kernel over the bars and maps its codes to 'BUY', 'SELL' or None."""
+        state = self.state
+        rows = state.row_ids(symbols)
+        out = np.empty(len(rows), dtype=np.int64)
+        update_and_signal(rows, open_price, close_price, volume, state.close, state.volume, state.head, state.count,
+                          self._macd_diff_weights, update, out)
+        return [SIGNAL_NAMES[code] for code in out.tolist()]
+
+    def generate_signals_vectorized(self, df):
+        """
+        Computes the `generate_signal` result for every row of a bar DataFrame in one vectorized pass,
+        as if the rows were streamed through `update_buffers` in order.
+
+        Indicators only ever see the last `buffer_size` bars of a symbol, so MACD's EMAs are evaluated
+        over that window too: for a given window length the MACD line and signal are linear in the
+        window's closes, and reduce to a dot product with precomputed weights.
+
+        :param df: Bars with 'symbol', 'open', 'close' and 'volume' columns, in chronological order.
+        :return: Series of 'BUY', 'SELL' or None aligned with `df.index`.
+        """
+        signals = np.zeros(len(df), dtype=int)
+        macd_weights = self.macd_weights
+
+        for rows in df.groupby('symbol', sort=False, observed=True).indices.values():
+            close = df['close'].to_numpy(dtype=float)[rows]
+            if len(close) < 20:
+                continue  # Never enough data for this symbol
+            volume = df['volume'].to_numpy(dtype=float)[rows]
+            bullish_bar = close > df['open'].to_numpy(dtype=float)[rows]
+
+            # Only bars with at least 20 buffered points produce signals
+            current = close[19:]
+            previous_close = close[18:-1]
+
+            # --- Bollinger Bands (20-period, 2 std dev) ---
+            close_windows = sliding_window_view(close, 20)
+            bb_middle = close_windows.mean(axis=1)
+            bb_std = close_windows.std(axis=1)
+            bb_upper = bb_middle + 2 * bb_std
+            bb_lower = bb_middle - 2 * bb_std
+            bb_vote = np.where((current > bb_upper) & (previous_close <= bb_upper), -1,
+                               np.where((current < bb_lower) & (previous_close >= bb_lower), 1, 0))
 
-        # --- Bollinger Bands Strategy ---
-        if close_price > indicators['bb_upper'] and previous_close <= float(indicators['bb_upper']):
-            signals.append('SELL')
-        elif close_price < indicators['bb_lower'] and previous_close >= float(indicators['bb_lower']):
-            signals.append('BUY')
+            # --- MACD (12,26,9) over each bar's buffer window ---
+            macd_diff = np.full(len(close), np.nan)
+            for t in range(19, min(len(close), self.buffer_size)):
+                macd_diff[t] = macd_weights[t + 1][2] @ close[:t + 1]
+            if len(close) >= self.buffer_size:
+                macd_diff[self.buffer_size - 1:] = sliding_window_view(close, self.buffer_size) @ macd_weights[self.buffer_size][2]
+            macd_diff = macd_diff[19:]
+            macd_vote = np.where(macd_diff > 0.1, 1, np.where(macd_diff < -0.1, -1, 0))
 
-        # --- MACD Crossover with Threshold ---
-        macd_diff = float(indicators['macd_line']) - float(indicators['macd_signal'])
-        if macd_diff > 0.1:  # Require significant divergence
-            signals.append('BUY')
-        elif macd_diff < -0.1:
-            signals.append('SELL')
+            # --- Volume spike above the 20-bar mean + 2 std ---
+            volume_windows = sliding_window_view(volume, 20)
+            volume_spike = volume[19:] > volume_windows.mean(axis=1) + 2 * volume_windows.std(axis=1, ddof=1)
+            volume_vote = np.where(volume_spike, np.where(bullish_bar[19:], 1, -1), 0)
 
-        # --- Volume Spike Confirmation ---
-        if volume > float(indicators['volume_ma']) + (2 * float(indicators['volume_std'])):
-            signals.append('BUY' if close_price > open_price else 'SELL')
+            # --- Voting System: 2 or more 'BUY' → BUY, 2 or more 'SELL' → SELL ---
+            votes = np.stack((bb_vote, macd_vote, volume_vote))
+            buy_count = (votes == 1).sum(axis=0)
+            sell_count = (votes == -1).sum(axis=0)
+            signals[rows[19:]] = np.where(buy_count >= 2, 1, np.where(sell_count >= 2, -1, 0))
 
-        # --- Voting System: 2 or more 'BUY' → BUY, 2 or more 'SELL' → SELL ---
-        buy_count = signals.count('BUY')
-        sell_count = signals.count('SELL')
+        return pd.Series(np.select([signals == 1, signals == -1], ['BUY', 'SELL'], None), index=df.index)
 
-        if buy_count >= 2:
-            return 'BUY'
-        if sell_count >= 2:
-            return 'SELL'
-        return None
+
+_BAR_FIELDS = itemgetter('open', 'close', 'volume')
+
+def _bar_arrays(securities):
+    """(open, close, volume) float arrays of a list of bars; numeric strings are parsed by NumPy in the same pass."""
+    bars = np.array([_BAR_FIELDS(sec) for sec in securities], dtype=float).reshape(-1, 3)
+    return bars[:, 0], bars[:, 1], bars[:, 2]
 
 
 
 class PortfolioManager:
     """
     Manages cash, positions, trade execution, and logs.
+    Positions are parallel arrays (quantity, average price) indexed by a symbol -> row map.
     """
-    def __init__(self):
+    __slots__ = ('cash', 'sym_idx', 'pos_qty', 'pos_avg', 'trade_log', 'history')
+
+    def __init__(self, capacity=64):
         self.cash = 100000.0
-        # Dictionary of symbol -> {'quantity': int, 'avg_price': float}
-        self.positions = defaultdict(dict)
+        self.sym_idx = {}  # symbol -> row in the position arrays
+        self.pos_qty = np.zeros(capacity, dtype=np.int64)
+        self.pos_avg = np.zeros(capacity)
         self.trade_log = []
         self.history = []
-        
+
+    def _row(self, symbol):
+        """Row of `symbol`, growing the position arrays when a new symbol appears."""
+        idx = self.sym_idx.get(symbol)
+        if idx is None:
+            idx = self.sym_idx[symbol] = len(self.sym_idx)
+            if idx == len(self.pos_qty):
+                self.pos_qty = np.concatenate((self.pos_qty, np.zeros_like(self.pos_qty)))
+                self.pos_avg = np.concatenate((self.pos_avg, np.zeros_like(self.pos_avg)))
+        return idx
+
+    @property
+    def open_count(self):
+        """Number of symbols currently held."""
+        return int(np.count_nonzero(self.pos_qty > 0))
+
     def execute_trade(self, symbol, signal, price, timestamp):
         """
         Buys or sells a fixed portion of the portfolio:
@@ -143,9 +202,9 @@ class PortfolioManager:
         
         if signal == 'BUY' and self.cash >= price * quantity:
             self._execute_buy(symbol, price, quantity, timestamp)
-        elif signal == 'SELL' and symbol in self.positions:
+        elif signal == 'SELL' and symbol in self.sym_idx:
             # Sell the lesser of "quantity" or what we hold
-            holdings = self.positions[symbol].get('quantity', 0)
+            holdings = int(self.pos_qty[self.sym_idx[symbol]])
             if holdings > 0:
                 sell_qty = min(quantity, holdings)
                 self._execute_sell(symbol, price, sell_qty, timestamp)
@@ -153,21 +212,17 @@ class PortfolioManager:
     def _execute_buy(self, symbol, price, quantity, timestamp):
         cost = price * quantity
         self.cash -= cost
-        if symbol in self.positions:
-            current_qty = self.positions[symbol]['quantity']
-            current_avg = self.positions[symbol]['avg_price']
+        idx = self._row(symbol)
+        current_qty = int(self.pos_qty[idx])
+        if current_qty > 0:
+            current_avg = float(self.pos_avg[idx])
             total_cost = (current_avg * current_qty) + cost
             new_qty = current_qty + quantity
-            new_avg = total_cost / new_qty
-            self.positions[symbol].update({
-                'quantity': new_qty,
-                'avg_price': new_avg
-            })
+            self.pos_qty[idx] = new_qty
+            self.pos_avg[idx] = total_cost / new_qty
         else:
-            self.positions[symbol] = {
-                'quantity': quantity,
-                'avg_price': price
-            }
+            self.pos_qty[idx] = quantity
+            self.pos_avg[idx] = price
         
         self.trade_log.append({
             'timestamp': timestamp,
@@ -181,9 +236,12 @@ class PortfolioManager:
         revenue = price * quantity
         self.cash += revenue
         
-        self.positions[symbol]['quantity'] -= quantity
-        if self.positions[symbol]['quantity'] <= 0:
-            del self.positions[symbol]  # remove from dict if fully closed
+        idx = self.sym_idx[symbol]
+        self.pos_qty[idx] -= quantity
+        if self.pos_qty[idx] <= 0:
+            # Fully closed
+            self.pos_qty[idx] = 0
+            self.pos_avg[idx] = 0.0
         
         self.trade_log.append({
             'timestamp': timestamp,
@@ -193,99 +251,110 @@ class PortfolioManager:
             'quantity': quantity
         })
         
-    def update_valuation(self, timestamp, market_data):
+    def update_valuation(self, timestamp, symbols, close_price):
         """
         Recalculate total portfolio value:
           - total_value = cash + sum(market_value_of_all_positions)
           - unrealized = sum( (current_price - avg_price) * quantity ) across all positions
+        Positions without a price in this tick are left out.
+
+        :param symbols: Symbols of the tick's bars.
+        :param close_price: Close prices aligned with `symbols`.
         """
-        total_value = self.cash
-        unrealized = 0.0
-        
-        # Convert list of securities to a lookup of {symbol: close_price}
-        prices = {d['symbol']: float(d['close']) for d in market_data}
-        
-        for sym, info in self.positions.items():
-            qty = info['quantity']
-            avg_price = info['avg_price']
-            if sym in prices:
-                current_price = prices[sym]
-                position_value = current_price * qty
-                total_value += position_value
-                unrealized += (current_price - avg_price) * qty
+        # Close prices laid out like the position arrays (NaN for symbols missing from this tick)
+        prices_arr = np.full(len(self.pos_qty), np.nan)
+        for symbol, price in zip(symbols, close_price.tolist()):
+            idx = self.sym_idx.get(symbol)
+            if idx is not None:
+                prices_arr[idx] = price
+
+        mask = (self.pos_qty > 0) & ~np.isnan(prices_arr)
+        qty = self.pos_qty[mask]
+        total_value = self.cash + float((qty * prices_arr[mask]).sum())
+        unrealized = float(((prices_arr[mask] - self.pos_avg[mask]) * qty).sum())
         
         self.history.append({
             'timestamp': timestamp,
             'total_value': total_value,
             'unrealized': unrealized,
-            'positions': len(self.positions)
+            'positions': self.open_count
         })
         
         return total_value, unrealized
 
 
-def start_client():
+async def read_messages(reader, inbox):
+    """
+    Decodes each newline-framed JSON message from the server into `inbox`, so the next tick is read
+    and parsed while the previous one is being processed. Queues None once the server disconnects.
+    """
+    while line := await reader.readline():
+        if not line.strip():
+            continue
+        try:
+            await inbox.put(loads(line))
+        except JSONDecodeError:
+            print("⚠️ Invalid JSON data received, skipping...")
+    await inbox.put(None)
+
+
+async def start_client():
     strategy = TradingStrategy()
     portfolio = PortfolioManager()
     
     # Connect to local TCP server
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
-        print(f"✅ Connected to server at {HOST}:{PORT}")
+    reader, conn = await asyncio.open_connection(HOST, PORT, limit=READ_LIMIT)
+    set_nodelay(conn.get_extra_info('socket'))
+    print(f"✅ Connected to server at {HOST}:{PORT}")
+
+    # One decoded tick is buffered ahead of the strategy
+    inbox = asyncio.Queue(maxsize=1)
+    read_task = asyncio.create_task(read_messages(reader, inbox))
+    
+    # Open a CSV file to track portfolio changes over time, held open for the whole session
+    report_file = 'data/trading_session_report.csv'
+    with open(report_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as report_fh:
+        report_fh.write('Timestamp,Total Value,Unrealized PnL,Positions Held\n')
+        report_rows = 0
         
-        # Open a CSV file to track portfolio changes over time
-        report_file = 'data/trading_session_report.csv'
-        with open(report_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Timestamp', 'Total Value', 'Unrealized PnL', 'Positions Held'])
+        # Main data loop: one tick per message, until the server disconnects
+        while (message := await inbox.get()) is not None:
+            timestamp = message['timestamp']
+            securities = message['data']
+            # Bar values arrive as strings; convert the tick's columns to arrays in one pass
+            symbols = [sec['symbol'] for sec in securities]
+            open_price, close_price, volume = _bar_arrays(securities)
         
-        # Main data loop
-        while True:
-            try:
-                data = s.recv(65535)
-                if not data:
-                    # Server disconnected or no more data
-                    break
-                
-                # Parse JSON from server
-                message = json.loads(data.decode())
-                timestamp = message['timestamp']
-                securities = message['data']
-                
-                print(f"\n📅 Received market data for {timestamp}")
-                
-                # Step 1: Update strategy buffers & generate signals
-                for sec in securities:
-                    symbol = sec['symbol']
-                    strategy.update_buffers(symbol, sec)
-                    signal = strategy.generate_signal(symbol, sec)
-                    
-                    if signal:
-                        price = float(sec['close'])
-                        print(f"🚨 Signal: {symbol} {signal} at ${price:.2f}")
-                        portfolio.execute_trade(symbol, signal, price, timestamp)
-                
-                # Step 2: Update portfolio valuation
-                total_value, unrealized = portfolio.update_valuation(timestamp, securities)
-                
-                # Step 3: Print summary
-                print(f"\n💰 Portfolio Summary:")
-                print(f"Cash: ${portfolio.cash:,.2f}")
-                print(f"Total Value: ${total_value:,.2f}")
-                print(f"Unrealized PnL: ${unrealized:+,.2f}")
-                print(f"Positions Held: {len(portfolio.positions)}")
-                
-                # Step 4: Append a CSV row
-                with open(report_file, 'a', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([timestamp, round(total_value, 2), round(unrealized, 2), len(portfolio.positions)])
-                    
-            except json.JSONDecodeError:
-                print("⚠️ Invalid JSON data received, skipping...")
-                continue
+            log.debug("📅 Received market data for %s", timestamp)
+        
+            # Step 1: Update strategy buffers & generate signals for the whole tick at once
+            signals = strategy.generate_tick_signals(symbols, open_price, close_price, volume)
+            for symbol, price, signal in zip(symbols, close_price.tolist(), signals):
+                if signal:
+                    log.info("🚨 Signal: %s %s at $%.2f", symbol, signal, price)
+                    portfolio.execute_trade(symbol, signal, price, timestamp)
+        
+            # Step 2: Update portfolio valuation
+            total_value, unrealized = portfolio.update_valuation(timestamp, symbols, close_price)
+        
+            # Step 3: Log a summary every SUMMARY_EVERY ticks
+            if report_rows % SUMMARY_EVERY == 0:
+                log.info("💰 Portfolio Summary (%s): Cash: $%.2f, Total Value: $%.2f, Unrealized PnL: $%+.2f, Positions Held: %d",
+                         timestamp, portfolio.cash, total_value, unrealized, portfolio.open_count)
+        
+            # Step 4: Append a CSV row, formatted directly (timestamps never contain commas or quotes)
+            report_fh.write(f"{timestamp},{total_value:.2f},{unrealized:.2f},{portfolio.open_count}\n")
+            report_rows += 1
+            if report_rows % FLUSH_EVERY == 0:
+                report_fh.flush()
+
+    await read_task
+    conn.close()
+    await conn.wait_closed()
     
     print("\n✅ Trading session ended")
 
 
 if __name__ == "__main__":
-    start_client()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(start_client())
@@ -1,23 +1,39 @@
 #!/usr/bin/env python3
-# scripts/three_strategy_client.py
+# scripts/triple_factor_day_trader.py
 
 import socket
-import json
-import csv
-from collections import defaultdict, deque
+import logging
 from datetime import datetime, time
 
-import pandas as pd
 import numpy as np
 
-from ta.momentum import RSIIndicator
-from ta.trend import MACD
-from ta.volatility import BollingerBands
+from message_stream import parse_bar, read_lines, loads, JSONDecodeError, set_nodelay, set_receive_buffer
+from indicator_core import IncrementalIndicators, macd_window_weights, macd_weight_matrix
+
+# Per-tick messages are logged at DEBUG; signals, exits and the portfolio summary every SUMMARY_EVERY ticks at INFO
+log = logging.getLogger(__name__)
 
 # Server configuration
 HOST = "127.0.0.1"  # or wherever your TCP server is listening
 PORT = 9999
 
+# Session report is written through a 1 MiB buffer and flushed every FLUSH_EVERY rows
+WRITE_BUFFER_SIZE = 1 << 20
+FLUSH_EVERY = 1000
+
+SUMMARY_EVERY = 10
+
+# generate_signal result indexed by (buy flag << 1) | sell flag
+SIGNAL_LUT = (None, 'SELL', 'BUY', None)
+
+# Record layouts of the trade & valuation logs (BUY rows have NaN realized_pnl).
+# Timestamps and symbols are object fields: timestamps may carry an exit reason such as
+# " (PartialClose 50%)", and a fixed-width string field would silently cut long values off
+TRADE_DTYPE = np.dtype([('timestamp', 'O'), ('symbol', 'O'), ('action', 'U4'),
+                        ('price', 'f8'), ('quantity', 'i8'), ('realized_pnl', 'f8')])
+HISTORY_DTYPE = np.dtype([('timestamp', 'O'), ('total_value', 'f8'), ('realized_pnl', 'f8'),
+                          ('unrealized_pnl', 'f8'), ('positions', 'i8')])
+
 
 ###############################################################################
 #                           TRADING STRATEGY                                  #
@@ -32,47 +48,29 @@ class TradingStrategy:
     Now only requires 1 strong signal to trigger a trade (instead of 2/3).
     """
     
-    def __init__(self):
-        # Store up to 100 recent data points per symbol (sufficient for 20-bar indicators)
-        self.data_buffers = defaultdict(lambda: deque(maxlen=100))
+    def __init__(self, buffer_size=100):
+        # Rolling closes / volumes of up to `buffer_size` recent bars per symbol (sufficient for 20-bar indicators).
+        # Stored as float32 to halve the bytes read per bar; the compiled kernel returns float64 indicators,
+        # and trades / valuations keep using the message's float64 prices
+        self.buffer_size = buffer_size
+        self.state = IncrementalIndicators(buffer_size, dtype=np.float32)
+        # MACD line / signal weights for each window length, so MACD is a dot product with the buffered closes
+        weights = macd_window_weights(buffer_size)
+        self.macd_line_weights = macd_weight_matrix(weights, buffer_size, 0)
+        self.macd_signal_weights = macd_weight_matrix(weights, buffer_size, 1)
 
     def update_buffers(self, symbol, data_point):
-        """Append the latest data point (OHLCV) to the symbol's buffer."""
-        self.data_buffers[symbol].append(data_point)
+        """Append the latest data point's close and volume to the symbol's rolling state (O(1) per bar)."""
+        state = self.state
+        state.append(state.row_ids([symbol]), float(data_point['close']), float(data_point['volume']))
 
     def calculate_indicators(self, symbol):
-        """Calculate Bollinger Bands, MACD, RSI, and volume stats for the symbol."""
-        buffer = list(self.data_buffers[symbol])
-        if len(buffer) < 20:
-            return None  # Need at least 20 data points
-        
-        df = pd.DataFrame(buffer)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-        
-        # --- Bollinger Bands (20-period, 2 std dev) ---
-        bb = BollingerBands(df['close'], window=20, window_dev=2)
-        
-        # --- MACD (12, 26, 9) ---
-        macd = MACD(df['close'], window_slow=26, window_fast=12, window_sign=9)
-        
-        # --- RSI (14) ---
-        rsi = RSIIndicator(df['close'], window=14)
-        
-        # --- Volume stats (rolling mean & std over 20 bars) ---
-        volume_ma = df['volume'].rolling(20).mean().iloc[-1]
-        volume_std = df['volume'].rolling(20).std().iloc[-1]
-
-        return {
-            'bb_upper': bb.bollinger_hband().iloc[-1],
-            'bb_lower': bb.bollinger_lband().iloc[-1],
-            'bb_middle': bb.bollinger_mavg().iloc[-1],
-            'macd_line': macd.macd().iloc[-1],
-            'macd_signal': macd.macd_signal().iloc[-1],
-            'rsi': rsi.rsi().iloc[-1],
-            'volume_ma': volume_ma,
-            'volume_std': volume_std
-        }
+        """
+        Calculate Bollinger Bands, MACD, and volume stats for the symbol from its rolling state.
+        Values match the `ta` BollingerBands / MACD indicators over the same buffered bars, and are
+        computed together in one compiled pass (`indicator_core.indicator_bundle`).
+        """
+        return self.state.indicators(symbol, self.macd_line_weights, self.macd_signal_weights)
 
     def generate_signal(self, symbol, current_data):
         """
@@ -88,57 +86,108 @@ class TradingStrategy:
         if not indicators:
             return None  # Not enough data yet
 
+        # Read every value once up front
+        bb_upper = indicators['bb_upper']
+        bb_lower = indicators['bb_lower']
+        macd_diff = indicators['macd_line'] - indicators['macd_signal']
+        volume_threshold = indicators['volume_ma'] + 2 * indicators['volume_std']
         close_price = float(current_data['close'])
         volume = float(current_data['volume'])
         open_price = float(current_data['open'])
+        # Close of the bar before the latest one, read from the same state as `generate_tick_signals`
+        prev_close = float(self.state.last_close(self.state.row_ids([symbol]), age=1)[0])
+
+        # Each trigger sets a BUY or a SELL flag (the two sides of a trigger are mutually exclusive)
+        volume_spike = volume > volume_threshold
+        bullish = close_price > open_price
+
+        # --- 1) Bollinger Band breakout, 2) MACD (looser threshold = +/-0.05), 3) Volume Spike ---
+        # A volume spike on a bullish candle => BUY, else SELL
+        buy_signal = ((close_price > bb_upper and prev_close <= bb_upper)
+                      | (macd_diff > 0.05)
+                      | (volume_spike and bullish))
+        sell_signal = ((close_price < bb_lower and prev_close >= bb_lower)
+                       | (macd_diff < -0.05)
+                       | (volume_spike and not bullish))
+
+        # Decide final output: single-factor approach (conflicting flags => None)
+        return SIGNAL_LUT[(buy_signal << 1) | sell_signal]
+
+    def generate_tick_signals(self, securities):
+        """
+        Appends every bar of one tick to the rolling state and returns the `generate_signal` result for each,
+        computing all symbols' indicators in one compiled call and the triggers as array operations.
 
-        # Safely get the previous close
-        buffer_list = self.data_buffers[symbol]
-        if len(buffer_list) > 1:
-            try:
-                prev_close = float(buffer_list[-2]['close'])
-            except (KeyError, ValueError, TypeError):
-                prev_close = close_price
-        else:
-            prev_close = close_price
-
-        # Flags to track potential signals
-        buy_signal = False
-        sell_signal = False
-
-        # --- 1) Bollinger Band Logic ---
-        if close_price > indicators['bb_upper'] and prev_close <= indicators['bb_upper']:
-            buy_signal = True
-        elif close_price < indicators['bb_lower'] and prev_close >= indicators['bb_lower']:
-            sell_signal = True
-
-        # --- 2) MACD Crossover (looser threshold = +/-0.05) ---
-        macd_diff = indicators['macd_line'] - indicators['macd_signal']
-        if macd_diff > 0.05:
-            buy_signal = True
-        elif macd_diff < -0.05:
-            sell_signal = True
-
-        # --- 3) Volume Spike ---
-        # If volume is > mean + 2 std, bullish candle => BUY, else SELL
-        if volume > indicators['volume_ma'] + (2 * indicators['volume_std']):
-            if close_price > open_price:
-                buy_signal = True
-            else:
-                sell_signal = True
-
-        # Decide final output: single-factor approach
-        if buy_signal and not sell_signal:
-            return 'BUY'
-        elif sell_signal and not buy_signal:
-            return 'SELL'
-        return None
+        :param securities: Parsed bars of one timestamp, each symbol at most once.
+        :return: List of 'BUY', 'SELL' or None aligned with `securities`.
+        """
+        state = self.state
+        n = len(securities)
+        rows = state.row_ids([sec['symbol'] for sec in securities])
+        close_price = np.fromiter((float(sec['close']) for sec in securities), dtype=float, count=n)
+        volume = np.fromiter((float(sec['volume']) for sec in securities), dtype=float, count=n)
+        open_price = np.fromiter((float(sec['open']) for sec in securities), dtype=float, count=n)
+
+        # Previous close is the latest buffered one (the bar's own close for a symbol's first bar)
+        prev_close = np.where(state.count[rows] > 0, state.last_close(rows), close_price)
+        state.append(rows, close_price, volume)
+
+        bb_upper, bb_lower, _, macd_line, macd_signal, volume_ma, volume_std = \
+            state.indicators_batch(rows, self.macd_line_weights, self.macd_signal_weights).T
+        macd_diff = macd_line - macd_signal
+        volume_spike = volume > volume_ma + 2 * volume_std
+        bullish = close_price > open_price
+
+        # Same triggers as generate_signal; rows without enough data are NaN and never trigger
+        buy_signal = ((close_price > bb_upper) & (prev_close <= bb_upper)) | (macd_diff > 0.05) | (volume_spike & bullish)
+        sell_signal = ((close_price < bb_lower) & (prev_close >= bb_lower)) | (macd_diff < -0.05) | (volume_spike & ~bullish)
+        codes = (buy_signal.astype(np.int64) << 1) | sell_signal
+        return [SIGNAL_LUT[code] for code in codes.tolist()]
 
 
 ###############################################################################
 #                           PORTFOLIO MANAGEMENT                              #
 ###############################################################################
 
+class RecordLog:
+    """
+    Append-only log of fixed-layout records in a preallocated NumPy structured array, doubled when full.
+    Indexing and len() behave like the list it replaces; `records` is a view of the filled rows.
+    """
+    __slots__ = ('_data', '_n')
+
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._n = 0
+
+    def append(self, record):
+        """Writes `record` (a tuple in dtype field order) into the next free row."""
+        if self._n == len(self._data):
+            self._grow()
+        self._data[self._n] = record
+        self._n += 1
+
+    def extend(self, records):
+        """Writes a structured array of records into the next free rows as one block copy."""
+        end = self._n + len(records)
+        while end > len(self._data):
+            self._grow()
+        self._data[self._n:end] = records
+        self._n = end
+
+    def _grow(self):
+        self._data = np.concatenate((self._data, np.zeros_like(self._data)))
+
+    @property
+    def records(self):
+        return self._data[:self._n]
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        return self.records[i]
+
 class PortfolioManager:
     """
     Manages:
@@ -151,20 +200,24 @@ class PortfolioManager:
 
     Tracks realized & unrealized PnL in a CSV report.
     """
-    def __init__(self):
+    def __init__(self, capacity=64):
         self.cash = 100_000.0
 
-        # Positions: symbol -> {
-        #   'quantity': int,
-        #   'avg_price': float,
-        #   'stop_price': float,
-        #   'take_profit_price': float
-        # }
-        self.positions = defaultdict(dict)
+        # Positions as parallel arrays, one row per symbol ever traded (quantity 0 = not held):
+        #   quantity, average price, stop price, take-profit price, and the sequence number of the
+        #   position's opening, so exits are swept (and logged) in the order the positions were opened
+        self.sym_idx = {}  # symbol -> row in the position arrays
+        self.symbols = []  # row -> symbol
+        self.pos_qty = np.zeros(capacity, dtype=np.int64)
+        self.pos_avg = np.zeros(capacity)
+        self.pos_stop = np.zeros(capacity)
+        self.pos_take_profit = np.zeros(capacity)
+        self.pos_opened = np.zeros(capacity, dtype=np.int64)
+        self._open_seq = 0
         
         # Trade & Valuation Logs
-        self.trade_log = []
-        self.history = []
+        self.trade_log = RecordLog(TRADE_DTYPE)
+        self.history = RecordLog(HISTORY_DTYPE)
         
         # Risk parameters
         self.stop_loss_pct = 0.02      # 2% below entry
@@ -176,6 +229,40 @@ class PortfolioManager:
         # Trailing stop buffer in % (optional)
         self.trailing_stop_buffer = 0.02
 
+    def _row(self, symbol):
+        """Row of `symbol`, growing the position arrays when a new symbol appears."""
+        idx = self.sym_idx.get(symbol)
+        if idx is None:
+            idx = self.sym_idx[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            if idx == len(self.pos_qty):
+                for name in ('pos_qty', 'pos_avg', 'pos_stop', 'pos_take_profit', 'pos_opened'):
+                    arr = getattr(self, name)
+                    setattr(self, name, np.concatenate((arr, np.zeros_like(arr))))
+        return idx
+
+    def price_vector(self, market_data):
+        """
+        Close prices laid out like the position arrays (NaN for symbols missing from `market_data`),
+        gathered in one pass. Build it once per tick, after the tick's trades, and share it between
+        `check_stop_loss_take_profit` and `update_valuation`.
+        """
+        sym_idx = self.sym_idx
+        known = [d for d in market_data if d['symbol'] in sym_idx]
+        prices = np.full(len(self.pos_qty), np.nan)
+        rows = np.fromiter((sym_idx[d['symbol']] for d in known), dtype=np.int64, count=len(known))
+        prices[rows] = np.fromiter((float(d['close']) for d in known), dtype=float, count=len(known))
+        return prices
+
+    def _by_open_order(self, rows):
+        """`rows` sorted by when their positions were opened (oldest first)."""
+        return rows[np.argsort(self.pos_opened[rows], kind='stable')]
+
+    @property
+    def open_count(self):
+        """Number of symbols currently held."""
+        return int(np.count_nonzero(self.pos_qty > 0))
+
     def execute_trade(self, symbol, signal, price, timestamp):
         """
         'BUY'  => buy up to 10% of cash or $1000, whichever is smaller,
@@ -183,8 +270,10 @@ class PortfolioManager:
         'SELL' => sell from existing position (no shorting).
         """
         # Skip BUY if already own the symbol
-        if signal == 'BUY' and symbol in self.positions and self.positions[symbol]['quantity'] > 0:
-            print(f"⚠️ Already holding {symbol}, skipping additional BUY.")
+        idx = self.sym_idx.get(symbol)
+        holdings = int(self.pos_qty[idx]) if idx is not None else 0
+        if signal == 'BUY' and holdings > 0:
+            log.debug("⚠️ Already holding %s, skipping additional BUY.", symbol)
             return
 
         max_investment = min(self.cash * 0.1, 1000)
@@ -196,54 +285,46 @@ class PortfolioManager:
             if self.cash >= (price * quantity):
                 self._execute_buy(symbol, price, quantity, timestamp)
         elif signal == 'SELL':
-            if symbol in self.positions and self.positions[symbol]['quantity'] > 0:
-                current_qty = self.positions[symbol]['quantity']
-                sell_qty = min(quantity, current_qty)
-                if sell_qty > 0:
-                    self._execute_sell(symbol, price, sell_qty, timestamp)
+            if holdings > 0:
+                sell_qty = min(quantity, holdings)
+                self._execute_sell(symbol, price, sell_qty, timestamp)
 
     def _execute_buy(self, symbol, price, quantity, timestamp):
         cost = price * quantity
         self.cash -= cost
         
-        if symbol in self.positions:
+        idx = self._row(symbol)
+        current_qty = int(self.pos_qty[idx])
+        if current_qty > 0:
             # Update existing position
-            current_qty = self.positions[symbol]['quantity']
-            current_avg = self.positions[symbol]['avg_price']
+            current_avg = float(self.pos_avg[idx])
             total_cost = (current_avg * current_qty) + cost
             new_qty = current_qty + quantity
             new_avg = total_cost / new_qty
-            
-            self.positions[symbol]['quantity'] = new_qty
-            self.positions[symbol]['avg_price'] = new_avg
-            # Adjust stop & take-profit
-            self.positions[symbol]['stop_price'] = new_avg * (1 - self.stop_loss_pct)
-            self.positions[symbol]['take_profit_price'] = new_avg * (1 + self.take_profit_pct)
         else:
-            # Create new position
-            self.positions[symbol] = {
-                'quantity': quantity,
-                'avg_price': price,
-                'stop_price': price * (1 - self.stop_loss_pct),
-                'take_profit_price': price * (1 + self.take_profit_pct),
-            }
+            # Open a new position
+            new_qty = quantity
+            new_avg = price
+            self._open_seq += 1
+            self.pos_opened[idx] = self._open_seq
+
+        self.pos_qty[idx] = new_qty
+        self.pos_avg[idx] = new_avg
+        # Stop & take-profit follow the average entry price
+        self.pos_stop[idx] = new_avg * (1 - self.stop_loss_pct)
+        self.pos_take_profit[idx] = new_avg * (1 + self.take_profit_pct)
         
-        self.trade_log.append({
-            'timestamp': timestamp,
-            'symbol': symbol,
-            'action': 'BUY',
-            'price': price,
-            'quantity': quantity,
-        })
+        self.trade_log.append((timestamp, symbol, 'BUY', price, quantity, np.nan))
 
     def _execute_sell(self, symbol, price, quantity, timestamp):
         """
         Execute a SELL, updating cash & realized PnL.
         """
-        if symbol not in self.positions or self.positions[symbol]['quantity'] < quantity:
+        idx = self.sym_idx.get(symbol)
+        if idx is None or self.pos_qty[idx] <= 0 or self.pos_qty[idx] < quantity:
             return  # Shouldn't happen, but just in case
 
-        avg_price = self.positions[symbol]['avg_price']
+        avg_price = float(self.pos_avg[idx])
         revenue = price * quantity
         realized_trade_pnl = (price - avg_price) * quantity
 
@@ -251,104 +332,107 @@ class PortfolioManager:
         self.realized_pnl += realized_trade_pnl
         self.cash += revenue
 
-        self.positions[symbol]['quantity'] -= quantity
-        if self.positions[symbol]['quantity'] <= 0:
-            del self.positions[symbol]
+        self.pos_qty[idx] -= quantity
+        if self.pos_qty[idx] <= 0:
+            # Fully closed
+            self.pos_qty[idx] = 0
+            self.pos_avg[idx] = 0.0
 
-        self.trade_log.append({
-            'timestamp': timestamp,
-            'symbol': symbol,
-            'action': 'SELL',
-            'price': price,
-            'quantity': quantity,
-            'realized_pnl': round(realized_trade_pnl, 2),
-        })
+        self.trade_log.append((timestamp, symbol, 'SELL', price, quantity, round(realized_trade_pnl, 2)))
 
-    def check_stop_loss_take_profit(self, market_data, timestamp):
+    def _execute_sells(self, rows, prices, quantities, timestamp):
+        """
+        `_execute_sell` for several positions at once (each row at most once, never more than held):
+        cash, realized PnL and positions are updated with array operations, and the trades are
+        added to the trade log as one block.
+        """
+        if len(rows) == 0:
+            return
+        realized_trade_pnl = (prices - self.pos_avg[rows]) * quantities
+
+        # Update realized PnL & cash; cumsum adds left to right, so the totals match selling one position at a time
+        self.realized_pnl = float(np.cumsum(np.concatenate(([self.realized_pnl], realized_trade_pnl)))[-1])
+        self.cash = float(np.cumsum(np.concatenate(([self.cash], prices * quantities)))[-1])
+
+        self.pos_qty[rows] -= quantities
+        closed = rows[self.pos_qty[rows] <= 0]  # Fully closed
+        self.pos_qty[closed] = 0
+        self.pos_avg[closed] = 0.0
+
+        trades = np.empty(len(rows), dtype=TRADE_DTYPE)
+        trades['timestamp'] = timestamp
+        trades['symbol'] = [self.symbols[idx] for idx in rows.tolist()]
+        trades['action'] = 'SELL'
+        trades['price'] = prices
+        trades['quantity'] = quantities
+        trades['realized_pnl'] = np.round(realized_trade_pnl, 2)
+        self.trade_log.extend(trades)
+
+    def check_stop_loss_take_profit(self, price_vec, timestamp):
         """
         For each held position, check if:
           - current_price <= stop_price => SELL all
           - current_price >= take_profit_price => SELL all
           - trailing stop adjustments (if price is above avg, ratchet up stop)
+        All positions are checked at once; only the exits are handled one by one.
+
+        :param price_vec: This tick's `price_vector`.
         """
-        prices = {d['symbol']: float(d['close']) for d in market_data}
-        
-        symbols_to_sell = []
-        for sym, pos in self.positions.items():
-            if sym not in prices:
-                continue
-            
-            current_price = prices[sym]
-            
-            # Trailing Stop Update
-            if current_price > pos['avg_price']:
-                # If new price is highest so far, raise the stop
-                new_stop = current_price * (1 - self.trailing_stop_buffer)
-                if new_stop > pos['stop_price']:
-                    pos['stop_price'] = new_stop
-
-            # Stop-loss triggered
-            if current_price <= pos['stop_price']:
-                symbols_to_sell.append((sym, current_price, 'StopLoss'))
-            # Take-profit triggered
-            elif current_price >= pos['take_profit_price']:
-                symbols_to_sell.append((sym, current_price, 'TakeProfit'))
-
-        for (sym, sell_price, reason) in symbols_to_sell:
-            qty = self.positions[sym]['quantity']
-            self._execute_sell(sym, sell_price, qty, f"{timestamp} ({reason})")
+        prices = price_vec
+        priced = (self.pos_qty > 0) & ~np.isnan(prices)
+
+        # Trailing Stop Update: while above the entry, raise the stop to the highest trailing level so far
+        np.maximum(self.pos_stop, prices * (1 - self.trailing_stop_buffer),
+                   out=self.pos_stop, where=priced & (prices > self.pos_avg))
+
+        # Stop-loss takes precedence over take-profit
+        stop_hit = priced & (prices <= self.pos_stop)
+        take_profit_hit = priced & ~stop_hit & (prices >= self.pos_take_profit)
+
+        for idx in self._by_open_order(np.flatnonzero(stop_hit | take_profit_hit)):
+            reason = 'StopLoss' if stop_hit[idx] else 'TakeProfit'
+            self._execute_sell(self.symbols[idx], float(prices[idx]), int(self.pos_qty[idx]), f"{timestamp} ({reason})")
 
     def partial_close(self, fraction, timestamp):
         """
         Sells a fraction (0.5 = 50%, etc.) of each open position.
         Useful near the end of day to lock partial profits.
         """
-        for sym in list(self.positions.keys()):
-            current_qty = self.positions[sym]['quantity']
-            if current_qty > 0:
-                qty_to_sell = int(current_qty * fraction)
-                if qty_to_sell < 1:
-                    continue
-                sell_price = self.positions[sym]['avg_price']  # or last known price
-                self._execute_sell(sym, sell_price, qty_to_sell, 
-                                   f"{timestamp} (PartialClose {fraction*100:.0f}%)")
+        self._close_fraction(fraction, f"{timestamp} (PartialClose {fraction*100:.0f}%)")
 
     def close_all_positions(self, timestamp):
         """
         Liquidate all positions (e.g. at 16:00).
         """
-        for sym in list(self.positions.keys()):
-            qty = self.positions[sym]['quantity']
-            avg_price = self.positions[sym]['avg_price']  # or last known close
-            self._execute_sell(sym, avg_price, qty, f"{timestamp} (EOD Liquidation)")
+        self._close_fraction(1.0, f"{timestamp} (EOD Liquidation)")
+
+    def _close_fraction(self, fraction, timestamp):
+        """Sells `fraction` of every open position (rounded down, skipping less than 1 share) in one sweep."""
+        rows = self._by_open_order(np.flatnonzero(self.pos_qty > 0))
+        qty_to_sell = (self.pos_qty[rows] * fraction).astype(np.int64)
+        rows, qty_to_sell = rows[qty_to_sell >= 1], qty_to_sell[qty_to_sell >= 1]
+        sell_price = self.pos_avg[rows]  # or last known price
+        self._execute_sells(rows, sell_price, qty_to_sell, timestamp)
 
-    def update_valuation(self, timestamp, market_data):
+    def update_valuation(self, timestamp, price_vec):
         """
         total_value = self.cash + sum(value of open positions).
         unrealized_pnl = sum((current_price - avg_price)*quantity).
+        Positions without a price in this tick's `price_vector` are valued at their average price.
         Returns (total_value, unrealized_pnl, realized_pnl).
         """
-        total_value = self.cash
-        unrealized_pnl = 0.0
+        prices = price_vec
+        held = self._by_open_order(np.flatnonzero(self.pos_qty > 0))
+        qty = self.pos_qty[held]
+        avg_price = self.pos_avg[held]
+        current_price = np.where(np.isnan(prices[held]), avg_price, prices[held])
 
-        prices = {d['symbol']: float(d['close']) for d in market_data}
-        
-        for sym, pos in self.positions.items():
-            qty = pos['quantity']
-            avg_price = pos['avg_price']
-            current_price = prices.get(sym, avg_price)
-            
-            total_value += current_price * qty
-            unrealized_pnl += (current_price - avg_price) * qty
+        # Sequential sums in open order (cumsum adds left to right), so the totals round like a per-position loop
+        total_value = float(np.cumsum(np.concatenate(([self.cash], current_price * qty)))[-1])
+        unrealized_pnl = float(np.cumsum(np.concatenate(([0.0], (current_price - avg_price) * qty)))[-1])
 
         # Log valuation
-        self.history.append({
-            'timestamp': timestamp,
-            'total_value': total_value,
-            'realized_pnl': self.realized_pnl,
-            'unrealized_pnl': unrealized_pnl,
-            'positions': len(self.positions)
-        })
+        self.history.append((timestamp, total_value, self.realized_pnl, unrealized_pnl, self.open_count))
 
         return total_value, unrealized_pnl, self.realized_pnl
 
@@ -357,27 +441,27 @@ class PortfolioManager:
 #                         HELPER FUNCTIONS                                    #
 ###############################################################################
 
-def is_end_of_day(timestamp_str):
+def parse_timestamp(timestamp_str):
     """
-    True if hour >= 16 (4PM).
+    Parse an ISO timestamp once per message (None if it isn't valid ISO);
+    the result is shared by `is_end_of_day` and `get_time`.
     """
     try:
-        dt = datetime.fromisoformat(timestamp_str)
-        if dt.hour >= 16:
-            return True
+        return datetime.fromisoformat(timestamp_str)
     except ValueError:
-        pass
-    return False
+        return None
 
-def get_time(timestamp_str):
+def is_end_of_day(dt):
     """
-    Extract time component from ISO string
+    True if hour >= 16 (4PM).
     """
-    try:
-        dt = datetime.fromisoformat(timestamp_str)
-        return dt.time()
-    except ValueError:
-        return None
+    return dt is not None and dt.hour >= 16
+
+def get_time(dt):
+    """
+    Extract time component from a parsed timestamp
+    """
+    return dt.time() if dt is not None else None
 
 
 ###############################################################################
@@ -390,89 +474,81 @@ def start_client():
     
     # Connect to local TCP server
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        set_nodelay(s)
+        set_receive_buffer(s)
         s.connect((HOST, PORT))
         print(f"✅ Connected to server at {HOST}:{PORT}")
         
-        # CSV file for reporting
+        # CSV file for reporting, held open (and closed on any exit) for the whole session
         report_file = 'data/trading_session_report.csv'
-        with open(report_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Timestamp', 'Total Value', 'Realized PnL', 'Unrealized PnL', 'Positions Held'])
-        
-        # Main loop
-        while True:
+        with open(report_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as report_fh:
+            report_fh.write('Timestamp,Total Value,Realized PnL,Unrealized PnL,Positions Held\n')
+            report_rows = 0
+            
+            # Main loop: one newline-framed JSON message per tick, until the server disconnects
             try:
-                data = s.recv(65535)
-                if not data:
-                    break  # No more data or server disconnected
-                
-                # Parse JSON from server (15-min bars)
-                message = json.loads(data.decode())
-                timestamp = message['timestamp']
-                securities = message['data']
+                for line in read_lines(s):
+                    try:
+                        # Parse JSON from server (15-min bars)
+                        message = loads(line)
+                        timestamp = message['timestamp']
+                        securities = [parse_bar(sec) for sec in message['data']]
                 
-                print(f"\n📅 Received market data for {timestamp}")
+                        log.debug("📅 Received market data for %s", timestamp)
                 
-                # 1. Strategy updates & signals
-                for sec in securities:
-                    symbol = sec['symbol']
-                    strategy.update_buffers(symbol, sec)
-                    signal = strategy.generate_signal(symbol, sec)
-                    
-                    # 2. Execute signals
-                    if signal:
-                        price = float(sec['close'])
-                        print(f"🚨 Signal: {symbol} {signal} at ${price:.2f}")
-                        portfolio.execute_trade(symbol, signal, price, timestamp)
+                        # 1. Strategy updates & signals for the whole tick at once
+                        signals = strategy.generate_tick_signals(securities)
+                        for sec, signal in zip(securities, signals):
+                            # 2. Execute signals
+                            if signal:
+                                symbol = sec['symbol']
+                                price = float(sec['close'])
+                                log.info("🚨 Signal: %s %s at $%.2f", symbol, signal, price)
+                                portfolio.execute_trade(symbol, signal, price, timestamp)
                 
-                # 3. Check stops / trailing / take-profit
-                portfolio.check_stop_loss_take_profit(securities, timestamp)
+                        # 3. Check stops / trailing / take-profit against this tick's prices
+                        price_vec = portfolio.price_vector(securities)
+                        portfolio.check_stop_loss_take_profit(price_vec, timestamp)
                 
-                # 4. Partial closures at 15:30 & 15:45 (optional)
-                t = get_time(timestamp)
-                if t == time(15, 30):
-                    print(f"⏰ 15:30 - Partial Exit (50%)")
-                    portfolio.partial_close(0.5, timestamp)
-                elif t == time(15, 45):
-                    print(f"⏰ 15:45 - Partial Exit (50%)")
-                    portfolio.partial_close(0.5, timestamp)
+                        # 4. Partial closures at 15:30 & 15:45 (optional)
+                        dt = parse_timestamp(timestamp)
+                        t = get_time(dt)
+                        if t == time(15, 30):
+                            log.info("⏰ 15:30 - Partial Exit (50%%)")
+                            portfolio.partial_close(0.5, timestamp)
+                        elif t == time(15, 45):
+                            log.info("⏰ 15:45 - Partial Exit (50%%)")
+                            portfolio.partial_close(0.5, timestamp)
                 
-                # 5. End-of-day liquidation
-                if is_end_of_day(timestamp):
-                    print(f"⏰ End of Day Reached – Closing all positions...")
-                    portfolio.close_all_positions(timestamp)
+                        # 5. End-of-day liquidation
+                        if is_end_of_day(dt):
+                            log.debug("⏰ End of Day Reached – Closing all positions...")
+                            portfolio.close_all_positions(timestamp)
                 
-                # 6. Calculate portfolio valuation
-                total_value, unrealized, realized = portfolio.update_valuation(timestamp, securities)
+                        # 6. Calculate portfolio valuation
+                        total_value, unrealized, realized = portfolio.update_valuation(timestamp, price_vec)
                 
-                # 7. Print summary
-                print(f"💰 Portfolio Summary:")
-                print(f"   Cash:          ${portfolio.cash:,.2f}")
-                print(f"   Total Value:   ${total_value:,.2f}")
-                print(f"   Realized PnL:  ${realized:+,.2f}")
-                print(f"   Unrealized PnL: ${unrealized:+,.2f}")
-                print(f"   Positions Held: {len(portfolio.positions)}")
+                        # 7. Log a summary every SUMMARY_EVERY ticks
+                        if report_rows % SUMMARY_EVERY == 0:
+                            log.info("💰 Portfolio Summary (%s): Cash: $%.2f, Total Value: $%.2f, "
+                                     "Realized PnL: $%+.2f, Unrealized PnL: $%+.2f, Positions Held: %d",
+                                     timestamp, portfolio.cash, total_value, realized, unrealized, portfolio.open_count)
                 
-                # 8. Log to CSV
-                with open(report_file, 'a', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([
-                        timestamp,
-                        round(total_value, 2),
-                        round(realized, 2),
-                        round(unrealized, 2),
-                        len(portfolio.positions)
-                    ])
+                        # 8. Log to CSV, formatted directly (timestamps never contain commas or quotes)
+                        report_fh.write(f"{timestamp},{total_value:.2f},{realized:.2f},{unrealized:.2f},{portfolio.open_count}\n")
+                        report_rows += 1
+                        if report_rows % FLUSH_EVERY == 0:
+                            report_fh.flush()
                     
-            except json.JSONDecodeError:
-                print("⚠️ Invalid JSON data received, skipping...")
-                continue
+                    except JSONDecodeError:
+                        print("⚠️ Invalid JSON data received, skipping...")
+                        continue
             except KeyboardInterrupt:
                 print("\n🔴 Ctrl+C detected – shutting down gracefully...")
-                break
     
     print("\n✅ Trading session ended")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     start_client()
@@ -1,5 +1,8 @@
 import os
 import time
+import asyncio
+from collections import deque
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
@@ -22,6 +25,18 @@ if not API_KEY or not SECRET_KEY:
 # Initialize Alpaca Historical Data Client
 stock_historical_data_client = StockHistoricalDataClient(API_KEY, SECRET_KEY)
 
+# Decode the (large) bar responses with orjson when it is installed; the SDK uses the standard library otherwise
+try:
+    import orjson
+
+    def decode_with_orjson(response, *args, **kwargs):
+        response.json = lambda **_: orjson.loads(response.content)
+        return response
+
+    stock_historical_data_client._session.hooks["response"].append(decode_with_orjson)
+except ImportError:
+    pass
+
 # Stock and ETF symbols
 stock_tickers = [
     "AAPL", "MSFT", "AMZN", "GOOGL", "META", "NVDA", "JPM", "TSLA", "JNJ", "V",
@@ -34,62 +49,129 @@ etfs = ["SPY", "DIA", "QQQ", "IWM", "VTI", "IYT", "IDU", "VXX"]
 
 symbols = stock_tickers + etfs
 
+# Symbol level dtype shared by every batch; categories are sorted so sorting by code is alphabetical
+SYMBOL_DTYPE = pd.CategoricalDtype(sorted(symbols))
+
+# Bar fields stored as float columns, in the order `BarSet.df` produces them
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "trade_count", "vwap")
+
 # Define timeframe and date range (Last 1 Year)
 now = datetime.now(ZoneInfo("America/Chicago"))
 start_date = now - timedelta(days=365)  # 1 year of data
 
 # Alpaca rate limits: 200 requests per minute
 BATCH_SIZE = 10  # Fetch 10 symbols per request
-RATE_LIMIT_DELAY = 10  # Adjust based on API speed
+MAX_CONCURRENT_REQUESTS = 3  # Batches in flight at once
+RATE_LIMIT = 200  # Requests allowed per RATE_WINDOW
+RATE_WINDOW = 60  # Seconds
 MAX_RETRIES = 5  # Number of retries for failures
 
-# Store data in a DataFrame
-all_data = []
+# Request fields shared by every batch, built once
+BAR_REQUEST_ARGS = dict(
+    timeframe=TimeFrame(amount=15, unit=TimeFrameUnit.Minute),  # 15-Minute bars
+    start=start_date,
+    adjustment=Adjustment.ALL
+)
+
+batches = [symbols[i:i + BATCH_SIZE] for i in range(0, len(symbols), BATCH_SIZE)]
+total_batches = len(batches)
+
+# Send times of the requests made in the last RATE_WINDOW seconds
+request_times = deque()
+
+async def wait_for_rate_limit():
+    """Sleep only while RATE_LIMIT requests have already been sent within the last RATE_WINDOW seconds."""
+    while True:
+        now = time.monotonic()
+        while request_times and now - request_times[0] >= RATE_WINDOW:
+            request_times.popleft()
+        if len(request_times) < RATE_LIMIT:
+            request_times.append(now)
+            return
+        print(f"⏳ Rate limit reached, waiting {RATE_WINDOW - (now - request_times[0]):.1f} seconds...")
+        await asyncio.sleep(RATE_WINDOW - (now - request_times[0]))
+
+def bar_arrays(bar_set):
+    """
+    Columns of one response as flat arrays: symbol codes, UTC timestamps (datetime64) and one float array
+    per bar field. Reading the Bar objects directly skips `.df`'s per-bar dicts and dtype inference.
+    """
+    bars = [bar for symbol_bars in bar_set.data.values() for bar in symbol_bars]
+    columns = {
+        "symbol": SYMBOL_DTYPE.categories.get_indexer([bar.symbol for bar in bars]),
+        "timestamp": pd.to_datetime([bar.timestamp for bar in bars], utc=True).tz_localize(None).to_numpy(),
+    }
+    for field in BAR_FIELDS:
+        columns[field] = np.fromiter((getattr(bar, field) for bar in bars), dtype=np.float64, count=len(bars))
+    return columns
+
+async def fetch_batch(sem, batch, batch_number):
+    """
+    Fetch the 15-minute bars of one batch of symbols, retrying on failure.
+    The blocking SDK call runs in a worker thread, so batches are fetched concurrently
+    while the semaphore bounds how many requests are in flight.
+    Returns the batch columns from `bar_arrays`, or None if nothing was fetched.
+    """
+    # Create request (validated once, reused by every retry)
+    req = StockBarsRequest(symbol_or_symbols=batch, **BAR_REQUEST_ARGS)
 
-# Fetch data in batches
-total_batches = (len(symbols) // BATCH_SIZE) + 1
-for i in range(0, len(symbols), BATCH_SIZE):
-    batch = symbols[i:i + BATCH_SIZE]
-    
     for attempt in range(MAX_RETRIES):
         try:
-            print(f"🔄 Fetching {len(batch)} symbols: {batch} (Batch {i//BATCH_SIZE + 1}/{total_batches})")
-
-            # Create request
-            req = StockBarsRequest(
-                symbol_or_symbols=batch,
-                timeframe=TimeFrame(amount=15, unit=TimeFrameUnit.Minute),  # 15-Minute bars
-                start=start_date,
-                adjustment=Adjustment.ALL
-            )
+            async with sem:
+                print(f"🔄 Fetching {len(batch)} symbols: {batch} (Batch {batch_number}/{total_batches})")
 
-            # Fetch data
-            df = stock_historical_data_client.get_stock_bars(req).df
-            if not df.empty:
-                all_data.append(df)
-                print(f"✅ Retrieved {len(df)} rows for {len(batch)} symbols.")
+                # Fetch data
+                await wait_for_rate_limit()
+                bars = await asyncio.to_thread(stock_historical_data_client.get_stock_bars, req)
 
-            # Break retry loop on success
-            break  
+            columns = bar_arrays(bars)
+            rows = len(columns["symbol"])
+            if rows == 0:
+                return None
+            print(f"✅ Retrieved {rows} rows for {len(batch)} symbols.")
+            return columns
 
         except Exception as e:
             print(f"⚠️ Error fetching {batch}: {e}")
             if attempt < MAX_RETRIES - 1:
                 print(f"🔄 Retrying in 5 seconds... ({attempt + 1}/{MAX_RETRIES})")
-                time.sleep(5)
+                await asyncio.sleep(5)
             else:
                 print(f"❌ Failed to fetch {batch} after {MAX_RETRIES} attempts. Skipping.")
+    return None
 
-    # Respect rate limit (wait only if more symbols remain)
-    if i + BATCH_SIZE < len(symbols):  
-        print(f"⏳ Waiting {RATE_LIMIT_DELAY} seconds to avoid rate limits...")
-        time.sleep(RATE_LIMIT_DELAY)
+async def fetch_all():
+    """Fetch every batch concurrently; results keep the batch order."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    results = await asyncio.gather(*(fetch_batch(sem, batch, n + 1) for n, batch in enumerate(batches)))
+    return [columns for columns in results if columns is not None]
+
+# Columns of every batch that returned bars
+all_data = asyncio.run(fetch_all())
 
 # Combine all data and save to CSV
 if all_data:
-    final_df = pd.concat(all_data)
-    final_df = final_df.sort_values(by=["timestamp", "symbol"])
+    # Join the batches column by column and build the DataFrame (and its MultiIndex) once
+    columns = {key: np.concatenate([batch[key] for batch in all_data]) for key in all_data[0]}
+    all_data.clear()  # Release the batch arrays before sorting, so at most two copies of the data are alive
+    index = pd.MultiIndex.from_arrays(
+        [pd.Categorical.from_codes(columns.pop("symbol"), dtype=SYMBOL_DTYPE),
+         pd.DatetimeIndex(columns.pop("timestamp")).tz_localize("UTC")],
+        names=["symbol", "timestamp"],
+    )
+    # Like `.df`, leave out fields that are missing from every bar
+    final_df = pd.DataFrame({field: values for field, values in columns.items() if not np.isnan(values).all()},
+                            index=index, copy=False)
+    # Each batch is already (symbol, timestamp) ordered; reorder the MultiIndex by timestamp, then symbol
+    final_df = final_df.sort_index(level=["timestamp", "symbol"])
     final_df.to_csv(os.path.join("data", "historical_stock_data_15min_1year.csv"), index=True)
     print(f"✅ Data successfully saved to CSV. Total rows: {len(final_df)}")
+
+    # Binary copy in backtest.py's cache format (flat, symbol as a category); written after the CSV so
+    # the backtest sees it as current and loads it directly instead of re-parsing the text
+    cache_df = final_df.reset_index()
+    cache_df["symbol"] = cache_df["symbol"].astype("category").cat.remove_unused_categories()
+    cache_df.to_pickle(os.path.join("data", "historical_stock_data_15min_1year.pkl"))
+    print("✅ Binary copy saved for the backtest.")
 else:
     print("❌ No data fetched.")
\ No newline at end of file